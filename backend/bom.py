@@ -0,0 +1,316 @@
+# backend/bom.py - bill-of-materials rollups over the kit_items graph
+"""
+Kits can contain kits. The engine loads the whole kit_items graph plus each
+item's price and stock in two queries, then answers per kit:
+
+- explosion: leaf item -> quantity needed for one kit, through every level
+- total_cost: sum of leaf quantity x unit price
+- buildable: how many kits the stock allows - the bottleneck leaf's stock
+  divided by the quantity one kit needs
+
+Kits on a cycle (or containing one) have no rollup; they are reported with
+the cycle instead. Explosions and rollups are memoized per kit.
+
+Only a change to kit_items (its own generation) reloads the graph; the
+reload diffs it against the previous one and drops only the memo entries of
+kits above a changed item or kit - the affected subgraph. Price and stock
+writes move just the items generation: the rows a rollup needs (the kit and
+its leaves) are then re-read by id, and only rollups above a row that
+actually changed are dropped - explosions depend on the structure alone.
+"""
+import logging
+import threading
+from backend.cache_manager import CacheManager
+from backend.database import Database
+
+logger = logging.getLogger(__name__)
+db = Database()
+
+VISITING, DONE = 1, 2
+# Stale rows beyond this many are re-read with one scan of items rather than an IN list
+REFRESH_IN_LIMIT = 1000
+
+ITEM_COLUMNS = "SELECT id, code, name, unit_price, stock FROM items"
+
+
+def _item_row(row):
+    return (row['code'], row['name'], row['unit_price'], row['stock'])
+
+
+class BOMEngine:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.generation = None          # kit_items generation the graph was loaded at
+        self.items_generation = None    # items generation every row was last read at, if all were
+        self._fresh = {}                # id -> items generation the row was read at
+        self.items = {}          # id -> (code, name, unit_price, stock)
+        self.children = {}       # kit id -> [(component id, quantity)]
+        self.parents = {}        # component id -> set of kit ids
+        self.cyclic = set()      # kits on, or above, a cycle
+        self.cycles = {}         # kit id on a cycle -> the cycle as a list of ids
+        self._explosions = {}
+        self._rollups = {}
+        self.invalidated = 0
+        self.reloads = 0
+        self.row_refreshes = 0
+
+    # ----- loading -----
+    def ensure_fresh(self, kit_ids=None):
+        """True when rollups of kit_ids (every kit if None) can be answered from current rows.
+
+        Reloads the graph only if kit_items changed; otherwise re-reads just the
+        rows those kits need that were read before the last item write.
+        """
+        # Read before loading: a write that lands meanwhile moves them again and forces another read
+        generation = CacheManager.get_generation('kit_items')
+        items_generation = CacheManager.get_items_generation()
+        with self._lock:
+            if not (self.loaded and generation is not None and generation == self.generation):
+                if not self._load():
+                    return self.loaded
+                self.generation = generation
+                self.items_generation = items_generation
+                self._fresh = dict.fromkeys(self.items, items_generation)
+            return self._refresh_rows(kit_ids, items_generation)
+
+    def _refresh_rows(self, kit_ids, generation):
+        if generation is not None and generation == self.items_generation:
+            return True
+        if kit_ids is None:
+            return self._refresh_all(generation)
+        needed = set()
+        for kit_id in kit_ids:
+            needed.add(kit_id)
+            if kit_id in self.children and kit_id not in self.cyclic:
+                needed.update(self.explode(kit_id))
+        stale = [i for i in needed if generation is None or self._fresh.get(i) != generation]
+        if not stale:
+            return True
+        if len(stale) > REFRESH_IN_LIMIT:
+            return self._refresh_all(generation)
+        rows = db.execute_query(f"{ITEM_COLUMNS} WHERE id IN ({', '.join(['%s'] * len(stale))})", stale)
+        if rows is None:
+            logger.warning("⚠️ Could not refresh kit rows")
+            return False
+        found = {row['id']: _item_row(row) for row in rows}
+        changed = [i for i in stale if found.get(i) != self.items.get(i)]
+        for item_id in stale:
+            if item_id in found:
+                self.items[item_id] = found[item_id]
+            else:
+                self.items.pop(item_id, None)
+            self._fresh[item_id] = generation
+        self._invalidate_up(changed, structure=False)
+        self.row_refreshes += 1
+        return True
+
+    def _refresh_all(self, generation):
+        rows = db.execute_query(ITEM_COLUMNS)
+        if rows is None:
+            logger.warning("⚠️ Could not refresh kit rows")
+            return False
+        new_items = {row['id']: _item_row(row) for row in rows}
+        changed = [i for i in new_items.keys() | self.items.keys() if new_items.get(i) != self.items.get(i)]
+        self.items = new_items
+        self._fresh = dict.fromkeys(new_items, generation)
+        self.items_generation = generation
+        self._invalidate_up(changed, structure=False)
+        self.row_refreshes += 1
+        return True
+
+    def _load(self):
+        items = db.execute_query(ITEM_COLUMNS)
+        edges = db.execute_query("SELECT kit_id, item_id, quantity FROM kit_items ORDER BY kit_id, id")
+        if items is None or edges is None:
+            logger.warning("⚠️ Could not load the kit graph")
+            return False
+
+        new_items = {row['id']: _item_row(row) for row in items}
+        new_children = {}
+        for edge in edges:
+            components = new_children.setdefault(edge['kit_id'], {})
+            # Duplicate rows for one component add up, as the old SUM did
+            components[edge['item_id']] = components.get(edge['item_id'], 0) + (edge['quantity'] or 0)
+        new_children = {kit_id: list(components.items()) for kit_id, components in new_children.items()}
+
+        changed_items = {i for i in new_items.keys() | self.items.keys() if new_items.get(i) != self.items.get(i)}
+        changed_kits = {k for k in new_children.keys() | self.children.keys()
+                        if new_children.get(k) != self.children.get(k)}
+
+        self.items, self.children = new_items, new_children
+        self.parents = {}
+        for kit_id, components in new_children.items():
+            for item_id, _ in components:
+                self.parents.setdefault(item_id, set()).add(kit_id)
+        if changed_kits or not self.loaded:
+            self._find_cycles()
+        if self.loaded:
+            self._invalidate_up(changed_items | changed_kits)
+        else:
+            self._explosions, self._rollups = {}, {}
+        self.loaded = True
+        self.reloads += 1
+        logger.debug('🧩 Kit graph loaded: %s kits, %s changed items, %s changed kits',
+                     len(new_children), len(changed_items), len(changed_kits))
+        return True
+
+    def _find_cycles(self):
+        """Mark every kit that is on a cycle or contains one (iterative DFS)"""
+        state, cyclic, cycles = {}, set(), {}
+        for root in self.children:
+            if root in state:
+                continue
+            state[root] = VISITING
+            path, stack = [root], [(root, iter(self.children[root]))]
+            while stack:
+                node, components = stack[-1]
+                for child, _ in components:
+                    if child not in self.children:
+                        continue  # a leaf
+                    if child not in state:
+                        state[child] = VISITING
+                        path.append(child)
+                        stack.append((child, iter(self.children[child])))
+                        break
+                    if state[child] == VISITING:
+                        cycle = path[path.index(child):] + [child]
+                        for kit_id in cycle[:-1]:
+                            cycles.setdefault(kit_id, cycle)
+                        cyclic.update(cycle)
+                else:
+                    stack.pop()
+                    path.pop()
+                    state[node] = DONE
+                    if any(child in cyclic for child, _ in self.children[node]):
+                        cyclic.add(node)
+        self.cyclic, self.cycles = cyclic, cycles
+
+    def _invalidate_up(self, ids, structure=True):
+        """Forget the memo of every kit that contains any of ids, at any depth.
+
+        A row change (structure=False) leaves explosions alone - they only depend on kit_items.
+        """
+        seen, queue = set(), list(ids)
+        while queue:
+            node = queue.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            dropped = self._rollups.pop(node, None) is not None
+            if structure:
+                dropped = self._explosions.pop(node, None) is not None or dropped
+            if dropped:
+                self.invalidated += 1
+            queue.extend(self.parents.get(node, ()))
+
+    # ----- rollups -----
+    def explode(self, kit_id):
+        """Leaf item id -> quantity for one kit; None for a kit on or above a cycle"""
+        with self._lock:
+            if kit_id in self.cyclic:
+                return None
+            memo = self._explosions
+            stack = [kit_id]
+            while stack:
+                node = stack[-1]
+                if node in memo:
+                    stack.pop()
+                    continue
+                pending = [c for c, _ in self.children.get(node, ()) if c in self.children and c not in memo]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                leaves = {}
+                for child, quantity in self.children.get(node, ()):
+                    if child in self.children:
+                        for leaf, per_child in memo[child].items():
+                            leaves[leaf] = leaves.get(leaf, 0) + quantity * per_child
+                    else:
+                        leaves[child] = leaves.get(child, 0) + quantity
+                memo[node] = leaves
+            return memo[kit_id]
+
+    def rollup(self, kit_id, components=True):
+        """Cost and buildable count for one kit (plus its flattened components), or None if unknown"""
+        with self._lock:
+            if kit_id not in self.items:
+                return None
+            result = self._rollups.get(kit_id)
+            if result is None:
+                result = self._rollups[kit_id] = self._compute(kit_id)
+            result = dict(result)
+            if components and 'cycle' not in result:
+                result['components'] = self._components(kit_id)
+            return result
+
+    def rollup_all(self, components=False):
+        """Rollups of every kit that has components, in one pass over the memo"""
+        with self._lock:
+            return [self.rollup(kit_id, components) for kit_id in sorted(self.children)]
+
+    def _compute(self, kit_id):
+        code, name = self.items[kit_id][:2]
+        if kit_id in self.cyclic:
+            return {'kit_id': kit_id, 'kit_code': code, 'kit_name': name,
+                    'cycle': self.cycles.get(kit_id) or self._cycle_below(kit_id)}
+        total_cost, buildable, bottleneck = 0, None, None
+        for leaf_id, quantity in self.explode(kit_id).items():
+            unit_price, stock = self.items.get(leaf_id, (None, None, 0, 0))[2:]
+            total_cost += (unit_price or 0) * quantity
+            if quantity > 0:
+                can_build = max(stock or 0, 0) // quantity
+                # Ties go to the lower id, so the reported bottleneck is stable
+                if buildable is None or (can_build, leaf_id) < (buildable, bottleneck):
+                    buildable, bottleneck = can_build, leaf_id
+        return {
+            'kit_id': kit_id,
+            'kit_code': code,
+            'kit_name': name,
+            'total_cost': round(float(total_cost), 2),
+            'buildable': buildable or 0,
+            'bottleneck_item_id': bottleneck,
+        }
+
+    def _components(self, kit_id):
+        """The flattened explosion as rows, by item id"""
+        components = []
+        for leaf_id, quantity in sorted(self.explode(kit_id).items()):
+            leaf_code, leaf_name, unit_price, stock = self.items.get(leaf_id, (None, None, None, 0))
+            components.append({
+                'item_id': leaf_id,
+                'item_code': leaf_code,
+                'item_name': leaf_name,
+                'quantity': quantity,
+                'unit_price': float(unit_price) if unit_price is not None else None,
+                'stock': stock,
+            })
+        return components
+
+    def _cycle_below(self, kit_id):
+        # A kit above a cycle reports the first cycle it reaches
+        stack, seen = [kit_id], set()
+        while stack:
+            node = stack.pop()
+            if node in self.cycles:
+                return self.cycles[node]
+            if node not in seen:
+                seen.add(node)
+                stack.extend(c for c, _ in self.children.get(node, ()) if c in self.cyclic)
+        return []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'kits': len(self.children),
+                'cyclic_kits': len(self.cyclic),
+                'memoized': len(self._explosions),
+                'invalidated': self.invalidated,
+                'reloads': self.reloads,
+                'row_refreshes': self.row_refreshes,
+            }
+
+
+bom = BOMEngine()
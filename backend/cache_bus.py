@@ -0,0 +1,109 @@
+# backend/cache_bus.py - cache invalidation broadcast between app instances
+"""
+App Engine runs up to five instances, each with its own in-process cache
+state. When one instance invalidates, it publishes a small message on the
+bus and every instance (itself included) hands it to its subscribers.
+
+LocalBus delivers in-process and is what tests and single-instance runs
+use. RedisBus uses Redis pub/sub (CACHE_REDIS_URL) with a listener thread.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in messages, so receivers can tell their own echoes apart
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LocalBus:
+    """In-process bus - publish() calls every subscriber synchronously"""
+
+    name = 'local'
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def publish(self, message):
+        message = dict(message, origin=INSTANCE_ID, sent_at=time.time())
+        self._deliver(message)
+        return message
+
+    def _deliver(self, message):
+        for callback in list(self._subscribers):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"❌ Cache invalidation handler failed: {e}")
+
+    def close(self):
+        pass
+
+
+class RedisBus(LocalBus):
+    """Redis pub/sub bus - messages reach the subscribers of every instance"""
+
+    name = 'redis'
+    RECONNECT_DELAY = 5
+
+    def __init__(self, url, channel):
+        super().__init__()
+        import redis  # optional dependency, only needed with CACHE_REDIS_URL
+        self._redis = redis.Redis.from_url(url)
+        self.channel = channel
+        self._closed = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        super().subscribe(callback)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, name='cache-bus', daemon=True)
+            self._thread.start()
+
+    def publish(self, message):
+        message = dict(message, origin=INSTANCE_ID, sent_at=time.time())
+        try:
+            self._redis.publish(self.channel, json.dumps(message))
+        except Exception as e:
+            # The other instances stay stale until their keys expire - say so
+            logger.error(f"❌ Could not broadcast cache invalidation: {e}")
+            self._deliver(message)
+        return message
+
+    def _listen(self):
+        while not self._closed.is_set():
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for raw in pubsub.listen():
+                    if self._closed.is_set():
+                        break
+                    try:
+                        message = json.loads(raw['data'])
+                    except (TypeError, ValueError):
+                        continue
+                    self._deliver(message)
+            except Exception as e:
+                logger.warning(f"⚠️ Cache bus disconnected, retrying in {self.RECONNECT_DELAY}s: {e}")
+                self._closed.wait(self.RECONNECT_DELAY)
+
+    def close(self):
+        self._closed.set()
+
+
+def get_bus(config=Config):
+    """Redis pub/sub when CACHE_REDIS_URL is set, otherwise the in-process bus"""
+    if config.CACHE_REDIS_URL:
+        try:
+            return RedisBus(config.CACHE_REDIS_URL, config.CACHE_BUS_CHANNEL)
+        except ImportError:
+            logger.error("❌ CACHE_REDIS_URL is set but the redis package is not installed - using the local bus")
+    return LocalBus()
@@ -1,28 +1,465 @@
+import logging
+import math
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g, has_app_context
 from flask_caching import Cache
+from backend.cache_bus import INSTANCE_ID, get_bus
 from backend.config import Config
+from backend.database import Database
+
+logger = logging.getLogger(__name__)
 
 cache = Cache(config={
     'CACHE_TYPE': Config.CACHE_TYPE,
-    'CACHE_DEFAULT_TIMEOUT': Config.CACHE_DEFAULT_TIMEOUT
+    'CACHE_DEFAULT_TIMEOUT': Config.CACHE_DEFAULT_TIMEOUT,
+    'CACHE_REDIS_URL': Config.CACHE_REDIS_URL,
+    'CACHE_KEY_PREFIX': Config.CACHE_KEY_PREFIX
 })
+bus = get_bus()
+
+
+class InvalidationStats:
+    """How long invalidations from other instances take to arrive - the window they serve stale data"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+        self.total_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.last_lag_ms = None
+
+    def record_published(self):
+        with self._lock:
+            self.published += 1
+
+    def record_received(self, lag_ms):
+        with self._lock:
+            self.received += 1
+            self.total_lag_ms += lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self.last_lag_ms = lag_ms
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'bus': bus.name,
+                'instance': INSTANCE_ID,
+                'published': self.published,
+                'received_remote': self.received,
+                'avg_staleness_ms': round(self.total_lag_ms / self.received, 3) if self.received else None,
+                'max_staleness_ms': round(self.max_lag_ms, 3),
+                'last_staleness_ms': round(self.last_lag_ms, 3) if self.last_lag_ms is not None else None,
+            }
+
+
+invalidation_stats = InvalidationStats()
+
+
+class LocalCache:
+    """Bounded in-process LRU (L1) in front of the shared cache.
+
+    Values are stored pickled: the byte budget is exact, and callers that
+    mutate what they get back can't corrupt the cached copy.
+    """
+
+    def __init__(self, max_bytes, ttls):
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (namespace, expires_at, blob)
+        self.bytes = 0
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = Counter()
+
+    def get(self, key, namespace):
+        if not self.max_bytes:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses[namespace] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits[namespace] += 1
+            blob = entry[2]
+        return pickle.loads(blob)
+
+    def set(self, key, value, namespace, ttl=None):
+        if not self.max_bytes:
+            return
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        # One huge value must not flush the whole L1
+        if len(blob) > self.max_bytes // 4:
+            return
+        ttl = ttl or self.ttls.get(namespace, Config.CACHE_DEFAULT_TIMEOUT)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (namespace, time.monotonic() + ttl, blob)
+            self.bytes += len(blob)
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self.evictions[self._entries[oldest][0]] += 1
+                self._remove(oldest)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate(self, *namespaces):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[0] in namespaces]:
+                self._remove(key)
+
+    def _remove(self, key):
+        self.bytes -= len(self._entries.pop(key)[2])
+
+    def stats(self):
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses) | set(self.evictions)
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': sum(self.hits.values()),
+                'misses': sum(self.misses.values()),
+                'evictions': sum(self.evictions.values()),
+                'namespaces': {
+                    ns: {'hits': self.hits[ns], 'misses': self.misses[ns], 'evictions': self.evictions[ns]}
+                    for ns in sorted(namespaces)
+                },
+            }
+
+
+local_cache = LocalCache(Config.CACHE_L1_MAX_BYTES, Config.CACHE_L1_TTLS)
+
+
+class Flight:
+    """One in-progress load of a cache key that other callers can wait on"""
+
+    def __init__(self, key):
+        self.key = key
+        self.started = time.monotonic()
+        self.done = threading.Event()
+        # Set when this instance also holds the cross-instance lock in the shared cache
+        self.locked = False
+
+
+class SingleFlight:
+    """Per-key registry of loads in progress in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.counts = Counter()
+
+    def begin(self, key):
+        """(flight, leader) - the leader loads, everyone else waits on flight.done"""
+        with self._lock:
+            flight = self._flights.get(key)
+            # A leader that never released (e.g. a response that was never read) is given up on
+            if flight is not None and time.monotonic() - flight.started < Config.CACHE_LOCK_TIMEOUT:
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            return flight, True
+
+    def end(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.done.set()
+
+    def count(self, event):
+        with self._lock:
+            self.counts[event] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, in_flight=len(self._flights))
+
+
+flights = SingleFlight()
+# Stale-while-revalidate refreshes run here, off the request threads
+refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
 
 class CacheManager:
+    # Every key derived from a table embeds that table's generation. A write bumps
+    # the counter, which orphans all of those keys at once; they age out via the TTL.
+    # The same counters version the ETags of the HTTP list and detail endpoints.
+    VERSIONED_TABLES = ('items', 'kit_items', 'customers', 'invoices', 'quotations')
+
+    # L1 namespaces whose keys embed a table's generation
+    TABLE_NAMESPACES = {'items': ('items', 'kits')}
+
     @staticmethod
-    def get_items_cache_key():
-        return 'all_items'
-    
+    def _generation_key(table):
+        return f'{table}_generation'
+
+    @staticmethod
+    def get_generation(table):
+        # Broadcasts keep the local copy current; the short TTL covers a lost one
+        key = CacheManager._generation_key(table)
+        generation = local_cache.get(key, 'generation')
+        if generation is not None:
+            return generation
+        try:
+            generation = cache.get(key)
+            if generation is None:
+                # Seeded from the clock so an evicted counter never revives old keys
+                cache.add(key, int(time.time() * 1000), timeout=0)
+                generation = cache.get(key)
+        except Exception:
+            return None
+        if generation is not None:
+            local_cache.set(key, generation, 'generation', ttl=Config.CACHE_GENERATION_TTL)
+        return generation
+
+    @staticmethod
+    def get_items_generation():
+        return CacheManager.get_generation('items')
+
+    @staticmethod
+    def get_items_cache_key(variant='json'):
+        return f'all_items:{variant}:v{CacheManager.get_items_generation()}'
+
+    @staticmethod
+    def get_items_page_cache_key(variant, params):
+        query = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+        return f'items_page:{variant}:{query}:v{CacheManager.get_items_generation()}'
+
     @staticmethod
     def get_item_cache_key(item_id):
-        return f'item_{item_id}'
-    
+        return f'item_{item_id}:v{CacheManager.get_items_generation()}'
+
     @staticmethod
     def get_kit_names_cache_key():
-        return 'kit_names'
-    
+        return f'kit_names:v{CacheManager.get_items_generation()}'
+
+    @staticmethod
+    def get_non_kit_items_cache_key():
+        return f'non_kit_items:v{CacheManager.get_items_generation()}'
+
+    @staticmethod
+    def get_kit_components_cache_key(kit_id):
+        return f'kit_components_{kit_id}:v{CacheManager.get_items_generation()}'
+
+    @staticmethod
+    def lookup(key, namespace='items'):
+        """(value, stale) from L1, then L2 - (None, False) on a miss"""
+        entry = local_cache.get(key, namespace)
+        if entry is None:
+            try:
+                entry = cache.get(key)
+            except Exception:
+                return None, False  # Ignore cache errors
+            if entry is None:
+                return None, False
+            local_cache.set(key, entry, namespace)
+        value, fresh_until = entry
+        return value, time.time() > fresh_until
+
+    @staticmethod
+    def get(key, namespace='items'):
+        return CacheManager.lookup(key, namespace)[0]
+
+    @staticmethod
+    def set(key, value, timeout=None, namespace='items'):
+        # A failed query inside this request would otherwise be cached as "no rows"
+        if has_app_context() and getattr(g.get('db_session'), 'failed', False):
+            return
+        timeout = timeout or Config.CACHE_DEFAULT_TIMEOUT
+        # Kept CACHE_STALE_TTL past its freshness so it can be served while it refreshes
+        entry = (value, time.time() + timeout)
+        try:
+            cache.set(key, entry, timeout=timeout + Config.CACHE_STALE_TTL)
+        except Exception:
+            pass  # Ignore cache errors
+        local_cache.set(key, entry, namespace)
+
+    @staticmethod
+    def cached(key, loader, timeout=None, namespace='items'):
+        """Value stored under key, or loader()'s result (cached unless it is None).
+
+        Build the key before loading: if a write bumps the generation while
+        the loader runs, the result lands under the old key and is never served.
+        A stale value is returned at once and reloaded in the background.
+        """
+        value, stale = CacheManager.lookup(key, namespace)
+        if stale:
+            CacheManager.refresh_async(key, loader, timeout, namespace)
+        if value is not None:
+            return value
+        value, flight = CacheManager.acquire(key, namespace)
+        if value is not None:
+            return value
+        try:
+            value = loader()
+            if value is not None:
+                CacheManager.set(key, value, timeout, namespace)
+            return value
+        finally:
+            CacheManager.release(flight)
+
+    @staticmethod
+    def acquire(key, namespace='items'):
+        """After a miss: (value, None) if another caller loaded it meanwhile, else (None, flight).
+
+        Whoever gets a flight loads the value and must release() it. Only one
+        caller per key per process leads; across instances the leader also
+        takes a lock in the shared cache, and the other instances wait for its
+        result. Waiters that time out load it themselves.
+        """
+        flight, leader = flights.begin(key)
+        if not leader:
+            flights.count('coalesced')
+            flight.done.wait(Config.CACHE_LOCK_TIMEOUT)
+            value = CacheManager.get(key, namespace)
+            return (value, None) if value is not None else (None, None)
+
+        if CacheManager._lock(key):
+            flight.locked = True
+            return None, flight
+        # Another instance is loading it - poll the shared cache for its result
+        flights.count('waited_remote')
+        deadline = time.monotonic() + Config.CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = CacheManager.get(key, namespace)
+            if value is not None:
+                flights.end(flight)
+                return value, None
+        return None, flight
+
+    @staticmethod
+    def release(flight):
+        if flight is None or flight.done.is_set():
+            return
+        if flight.locked:
+            try:
+                cache.delete(CacheManager._lock_key(flight.key))
+            except Exception:
+                pass  # Ignore cache errors; the lock times out anyway
+        flights.end(flight)
+
+    @staticmethod
+    def refresh_async(key, loader, timeout=None, namespace='items'):
+        """Reload a stale key on the refresher pool unless someone is already loading it"""
+        flights.count('stale_served')
+        flight, leader = flights.begin(key)
+        if not leader:
+            return
+        if not CacheManager._lock(key):
+            flights.end(flight)
+            return
+        flight.locked = True
+        app = current_app._get_current_object()
+
+        def refresh():
+            try:
+                with app.app_context():
+                    value = loader()
+                    if value is not None:
+                        CacheManager.set(key, value, timeout, namespace)
+                flights.count('refreshed')
+            except Exception as e:
+                logger.warning(f"⚠️ Background refresh of {key} failed: {e}")
+            finally:
+                CacheManager.release(flight)
+
+        refresher.submit(refresh)
+
+    @staticmethod
+    def _lock_key(key):
+        return f'lock:{key}'
+
+    @staticmethod
+    def _lock(key):
+        try:
+            return cache.add(CacheManager._lock_key(key), INSTANCE_ID,
+                             timeout=math.ceil(Config.CACHE_LOCK_TIMEOUT))
+        except Exception:
+            return True  # No shared cache - nothing to coordinate with
+
     @staticmethod
     def clear_items_cache():
+        """Invalidate every item-derived key once the current transaction commits"""
+        CacheManager.touch('items')
+
+    @staticmethod
+    def touch(*tables):
+        """Move the tables' generations on once the current transaction commits"""
+        session = Database().session()
+        for table in tables:
+            session.after_commit(lambda table=table: CacheManager._bump_generation(table))
+
+    @staticmethod
+    def _bump_generation(table):
+        # Racing bumps may both write N+1 - either way every key built on N is dead
+        key = CacheManager._generation_key(table)
         try:
-            cache.delete(CacheManager.get_items_cache_key())
-            cache.delete(CacheManager.get_kit_names_cache_key())
-        except:
-            pass  # Ignore cache errors
\ No newline at end of file
+            generation = cache.get(key)
+            generation = generation + 1 if generation is not None else int(time.time() * 1000)
+            cache.set(key, generation, timeout=0)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not invalidate {table} cache: {e}")
+            generation = None
+        CacheManager._drop_local(table)
+        bus.publish({'namespace': table, 'generation': generation})
+        invalidation_stats.record_published()
+
+    @staticmethod
+    def on_invalidation(message):
+        """Apply an invalidation published by another instance"""
+        table = message.get('namespace')
+        if message.get('origin') == INSTANCE_ID or table not in CacheManager.VERSIONED_TABLES:
+            return
+        invalidation_stats.record_received(max(0.0, (time.time() - message.get('sent_at', time.time())) * 1000))
+        CacheManager._drop_local(table)
+        # With a shared cache the counter already moved; a per-process cache has
+        # its own counter (seeded from its own clock) and must move it here
+        key = CacheManager._generation_key(table)
+        try:
+            current = cache.get(key)
+            remote = message.get('generation')
+            if current is None or current != remote:
+                floor = current + 1 if current is not None else int(time.time() * 1000)
+                cache.set(key, max(floor, remote or 0), timeout=0)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not apply cache invalidation: {e}")
+
+    @staticmethod
+    def _drop_local(table):
+        # Old-generation L1 entries are unreachable already - free their memory now
+        local_cache.delete(CacheManager._generation_key(table))
+        local_cache.invalidate(*CacheManager.TABLE_NAMESPACES.get(table, ()))
+
+    @staticmethod
+    def stats():
+        return {
+            'type': Config.CACHE_TYPE,
+            'items_generation': CacheManager.get_items_generation(),
+            'l1': local_cache.stats(),
+            'single_flight': flights.stats(),
+            'invalidation': invalidation_stats.snapshot(),
+        }
+
+
+def init_app(app):
+    """Bind the cache to the app and start listening for other instances' invalidations"""
+    cache.init_app(app)
+
+    def handle_invalidation(message):
+        # Messages arrive on the bus thread, outside any request
+        with app.app_context():
+            CacheManager.on_invalidation(message)
+
+    bus.subscribe(handle_invalidation)
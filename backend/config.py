@@ -13,7 +13,75 @@ class Config:
     MYSQL_USER = "root"
     MYSQL_PASSWORD = "Root@8.0"
     MYSQL_DATABASE = "proj_auth_system"
+    # Storage backend: 'mysql' (Cloud SQL) or 'sqlite' for benchmarks/tests off App Engine
+    DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').lower()
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', ':memory:')
+    # Read replicas: comma-separated host[:port] or /unix/socket paths (database files for sqlite); SELECTs go here
+    MYSQL_REPLICAS = [r.strip() for r in os.environ.get('MYSQL_REPLICAS', '').split(',') if r.strip()]
+
+    # Connection pool - sized to the 8 gunicorn threads in app.yaml
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', 300))
+    DB_POOL_MAX_LIFETIME = int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+    DB_POOL_PING_INTERVAL = int(os.environ.get('DB_POOL_PING_INTERVAL', 30))
+    # Circuit breaker - trip after this many consecutive connect failures, probe after the cool-down
+    DB_BREAKER_THRESHOLD = int(os.environ.get('DB_BREAKER_THRESHOLD', 3))
+    DB_BREAKER_COOLDOWN = float(os.environ.get('DB_BREAKER_COOLDOWN', 30))
+
+    # Query instrumentation
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+    SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
+    # Development/test mode: per-request query counts and N+1 warnings
+    QUERY_DEBUG = os.environ.get('QUERY_DEBUG', '').lower() in ('1', 'true', 'yes')
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 3))
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 0))
+
+    # Logging - production runs at WARNING; LOG_LEVELS overrides per logger, e.g. "backend.routes=DEBUG,werkzeug=INFO"
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+    LOG_LEVELS = dict(
+        (name.strip(), level.strip().upper())
+        for name, _, level in (entry.partition('=') for entry in os.environ.get('LOG_LEVELS', '').split(','))
+        if name.strip() and level.strip()
+    )
+    # Fraction of DEBUG records kept (1 = all)
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1))
     
-    # Cache config
-    CACHE_TYPE = 'simple'
-    CACHE_DEFAULT_TIMEOUT = 300
\ No newline at end of file
+    # Seconds between checks of the hsn table for new codes (in-memory HSN index)
+    HSN_INDEX_REFRESH = float(os.environ.get('HSN_INDEX_REFRESH', 60))
+    # Lowest ranked similarity (0-1) that auto-fill accepts when no description contains the name
+    HSN_MIN_SCORE = float(os.environ.get('HSN_MIN_SCORE', 0.5))
+    # Most names one POST /api/hsn/auto-fill/batch call may resolve
+    HSN_BATCH_LIMIT = int(os.environ.get('HSN_BATCH_LIMIT', 500))
+
+    # GET /api/items?limit=...: page size when only filters are given, and the most one page may hold
+    ITEMS_PAGE_SIZE = int(os.environ.get('ITEMS_PAGE_SIZE', 100))
+    ITEMS_PAGE_MAX = int(os.environ.get('ITEMS_PAGE_MAX', 500))
+    # Most kit ids one POST /api/kits/batch call may list ("all" is not capped)
+    KITS_BATCH_LIMIT = int(os.environ.get('KITS_BATCH_LIMIT', 1000))
+    # Refuse (409) to finalize an invoice that would take an item below zero, instead of clamping at 0
+    STOCK_STRICT = os.environ.get('STOCK_STRICT', '').lower() in ('1', 'true', 'yes')
+
+    # Cache config - with CACHE_REDIS_URL every instance shares one Redis cache
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'RedisCache' if CACHE_REDIS_URL else 'simple')
+    CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'erp:')
+    CACHE_DEFAULT_TIMEOUT = 300
+    # Pub/sub channel that carries invalidations to the other instances
+    CACHE_BUS_CHANNEL = os.environ.get('CACHE_BUS_CHANNEL', 'erp:cache-invalidation')
+    # In-process L1 in front of the shared cache: byte budget (0 disables) and TTL seconds per namespace
+    CACHE_L1_MAX_BYTES = int(os.environ.get('CACHE_L1_MAX_BYTES', 32 * 1024 * 1024))
+    CACHE_L1_TTLS = dict(
+        {'items': 60, 'kits': 60, 'hsn': 300, 'customers': 60},
+        **{name.strip(): int(ttl) for name, _, ttl in
+           (entry.partition('=') for entry in os.environ.get('CACHE_L1_TTLS', '').split(','))
+           if name.strip() and ttl.strip()}
+    )
+    # How long an instance trusts its local copy of a generation counter if a broadcast is lost
+    CACHE_GENERATION_TTL = float(os.environ.get('CACHE_GENERATION_TTL', 5))
+    # Expired entries are still served (and refreshed in the background) for this many seconds
+    CACHE_STALE_TTL = int(os.environ.get('CACHE_STALE_TTL', 60))
+    # Concurrent misses on one key wait this long for the caller already loading it
+    CACHE_LOCK_TIMEOUT = float(os.environ.get('CACHE_LOCK_TIMEOUT', 10))
+    # Browsers reuse list/detail responses this long without asking; 0 = revalidate (ETag) every time
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 0))
\ No newline at end of file
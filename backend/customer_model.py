@@ -1,6 +1,8 @@
 from backend.database import Database
 from flask import request
+import logging
 
+logger = logging.getLogger(__name__)
 db = Database()
 
 class Customer:
@@ -17,7 +19,7 @@ class Customer:
     @staticmethod
     def create_tables():
         """Create customers table"""
-        print("📊 Creating customers table...")
+        logger.info('📊 Creating customers table...')
         queries = [
             """
             CREATE TABLE IF NOT EXISTS customers (
@@ -41,11 +43,11 @@ class Customer:
             try:
                 result = db.execute_query(query)
                 if result is None:
-                    print(f"⚠️ Warning: Customer table creation query failed")
+                    logger.warning('⚠️ Warning: Customer table creation query failed')
                 else:
-                    print(f"✅ Customers table created/verified")
+                    logger.info('✅ Customers table created/verified')
             except Exception as e:
-                print(f"❌ Error creating customers table: {e}")
+                logger.warning('❌ Error creating customers table: %s', e)
     
     def save(self):
         """Save or update customer in database"""
@@ -63,7 +65,8 @@ class Customer:
                     self.gstin, self.state_code, self.status, self.id
                 )
                 result = db.execute_query(query, params)
-                return self.id if result else None
+                # An UPDATE has no lastrowid (0) - only None means it failed
+                return self.id if result is not None else None
             else:
                 # INSERT new customer
                 query = """
@@ -81,7 +84,7 @@ class Customer:
                     return self.id
                 return None
         except Exception as e:
-            print(f"💥 Error in Customer.save(): {e}")
+            logger.error('💥 Error in Customer.save(): %s', e)
             return None
     
     @staticmethod
@@ -91,7 +94,7 @@ class Customer:
             result = db.execute_query("SELECT * FROM customers ORDER BY name")
             return result if result else []
         except Exception as e:
-            print(f"❌ Error in Customer.get_all(): {e}")
+            logger.warning('❌ Error in Customer.get_all(): %s', e)
             return []
     
     @staticmethod
@@ -101,7 +104,7 @@ class Customer:
             result = db.execute_query("SELECT * FROM customers WHERE id = %s", (customer_id,))
             return result[0] if result else None
         except Exception as e:
-            print(f"❌ Error in Customer.get_by_id(): {e}")
+            logger.warning('❌ Error in Customer.get_by_id(): %s', e)
             return None
     
     @staticmethod
@@ -118,7 +121,7 @@ class Customer:
             result = db.execute_query(query, params)
             return result if result else []
         except Exception as e:
-            print(f"❌ Error in Customer.search_by_name(): {e}")
+            logger.warning('❌ Error in Customer.search_by_name(): %s', e)
             return []
     
     @staticmethod
@@ -127,5 +130,5 @@ class Customer:
         try:
             return db.execute_query("DELETE FROM customers WHERE id = %s", (customer_id,))
         except Exception as e:
-            print(f"❌ Error in Customer.delete(): {e}")
+            logger.warning('❌ Error in Customer.delete(): %s', e)
             return None
\ No newline at end of file
@@ -1,21 +1,24 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 from backend.database import Database
+from backend.streaming import stream_rows
+from backend.cache_manager import CacheManager
+from backend.http_cache import conditional
+import logging
 
 customer_bp = Blueprint('customer_bp', __name__)
+logger = logging.getLogger(__name__)
 db = Database()
 
 @customer_bp.route('/api/customers', methods=['GET'])
 @cross_origin()
+@conditional('customers')
 def get_customers():
     try:
         query = "SELECT * FROM customers ORDER BY created_date DESC"
-        result = db.execute_query(query)
-        return jsonify(result if result else []), 200
+        return stream_rows(db.execute_stream(query)), 200
     except Exception as e:
-        print("❌ Error loading customers:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception('❌ Error loading customers: %s', e)
         return jsonify({"error": str(e)}), 500
 
 @customer_bp.route('/api/customers', methods=['POST'])
@@ -23,10 +26,8 @@ def get_customers():
 def add_customer():
     try:
         data = request.json
-        print("\n" + "="*50)
-        print("💾 Creating customer from customer.html")
-        print("="*50)
-        print(f"Received data: {data}")
+        logger.debug('💾 Creating customer from customer.html')
+        logger.debug('Received data: %s', data)
         
         # Validate required fields
         if not data.get('name'):
@@ -52,22 +53,21 @@ def add_customer():
             data.get('status', 'Active')
         )
         
-        print(f"Executing query with params: {params}")
+        logger.debug('Executing query with params: %s', params)
         result = db.execute_query(query, params)
         
         if result:
-            print(f"✅ Customer created with ID: {result}")
+            CacheManager.touch('customers')
+            logger.debug('✅ Customer created with ID: %s', result)
             return jsonify({
                 "message": "Customer added successfully!",
                 "customer_id": result,
                 "success": True
             }), 201
         else:
-            print("❌ Failed to create customer")
+            logger.warning('❌ Failed to create customer')
             return jsonify({"error": "Failed to create customer"}), 500
             
     except Exception as e:
-        print(f"💥 Error adding customer: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('💥 Error adding customer: %s', e)
         return jsonify({"error": str(e)}), 500
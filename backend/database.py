@@ -1,37 +1,687 @@
 # backend/database.py - SIMPLIFIED
 import pymysql
+import itertools
 import logging
+import threading
+import time
+from collections import deque
+from flask import g, has_app_context, current_app, jsonify, request
+from pymysql.constants import SERVER_STATUS
 from backend.config import Config
+from backend.query_stats import InstrumentedCursor
+from backend import sqlite_compat
 
 logger = logging.getLogger(__name__)
 
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within DB_POOL_TIMEOUT"""
+
+
+class DatabaseUnavailable(Exception):
+    """Raised without touching the database while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops connect attempts after repeated failures so requests fail fast.
+
+    closed    - connects go through; failure_threshold consecutive failures trip it
+    open      - connects are refused until reset_timeout has passed
+    half_open - exactly one probe connect is let through; success closes, failure re-opens
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._trips = 0
+        self._rejected = 0
+
+    def is_open(self):
+        """True while calls should be refused outright (no probe is due yet)"""
+        with self._lock:
+            return self._refusing_locked()
+
+    def retry_after(self):
+        """Seconds until the next probe is allowed"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0, int(self._opened_at + self.reset_timeout - time.monotonic()) + 1)
+
+    def before_call(self):
+        """Claim permission to try a connect, or raise DatabaseUnavailable"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._refusing_locked():
+                self._rejected += 1
+                raise DatabaseUnavailable(f"Database circuit open, retry in {self.reset_timeout}s")
+            # Cool-down over: this caller is the half-open probe
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+        logger.info("🔌 Circuit half-open - probing database")
+
+    def record_success(self):
+        with self._lock:
+            recovered = self._state != self.CLOSED
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+        if recovered:
+            logger.info("✅ Database reachable again - circuit closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._state == self.HALF_OPEN
+            if probe_failed or self._failures >= self.failure_threshold:
+                if self._state == self.CLOSED:
+                    self._trips += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                tripped = True
+            else:
+                tripped = False
+        if tripped:
+            logger.error(f"🚫 Database circuit open for {self.reset_timeout}s after {self._failures} failures")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'trips': self._trips,
+                'rejected': self._rejected,
+            }
+
+    def _refusing_locked(self):
+        if self._state == self.CLOSED:
+            return False
+        if self._state == self.HALF_OPEN:
+            # Only the probe gets through until it reports back
+            return self._probe_in_flight
+        return time.monotonic() - self._opened_at < self.reset_timeout
+
+
+class PooledConnection:
+    """A checked-out pool connection - close() hands it back instead of closing it"""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def cursor(self, cursor=None):
+        raw_cursor = self._raw.cursor(cursor) if cursor else self._raw.cursor()
+        unbuffered = cursor is not None and issubclass(cursor, pymysql.cursors.SSCursor)
+        return InstrumentedCursor(raw_cursor, count_rows=not unbuffered)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, self._created_at)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of database connections"""
+
+    def __init__(self, connect, size, timeout, max_idle, max_lifetime, ping_interval):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (raw, created_at, last_used) - newest on the right
+        self._open = 0
+        self._counters = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'evicted_idle': 0,
+            'health_check_failures': 0,
+            'connect_failures': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def acquire(self):
+        """Check out a healthy connection, opening a new one if the pool has room"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            candidate = None
+            stale = []
+            with self._lock:
+                while candidate is None:
+                    now = time.monotonic()
+                    stale.extend(self._evict_idle_locked(now))
+                    if self._idle:
+                        # LIFO keeps a small hot set busy and lets the rest idle out
+                        candidate = self._idle.pop()
+                    elif self._open < self.size:
+                        self._open += 1
+                        break
+                    else:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._counters['timeouts'] += 1
+                            raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                        self._counters['waits'] += 1
+                        self._lock.wait(remaining)
+            self._close_all(stale)
+
+            if candidate is None:
+                return self._open_new()
+
+            raw, created_at, last_used = candidate
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime:
+                self._discard(raw, 'recycled')
+                continue
+            if now - last_used > self.ping_interval and not self._is_healthy(raw):
+                self._discard(raw, 'health_check_failures')
+                continue
+
+            with self._lock:
+                self._counters['reused'] += 1
+            return PooledConnection(self, raw, created_at)
+
+    def release(self, raw, created_at):
+        """Return a connection to the pool, dropping it if it is broken or too old"""
+        now = time.monotonic()
+        if not getattr(raw, 'open', True):
+            self._discard(raw, None)
+            return
+        if now - created_at > self.max_lifetime:
+            self._discard(raw, 'recycled')
+            return
+
+        try:
+            # Never hand the next caller a half-finished transaction
+            if _in_transaction(raw):
+                raw.rollback()
+            if not raw.get_autocommit():
+                raw.autocommit(True)
+        except Exception as e:
+            logger.warning(f"⚠️ Dropping connection that failed to reset: {e}")
+            self._discard(raw, None)
+            return
+
+        with self._lock:
+            self._idle.append((raw, created_at, now))
+            self._lock.notify()
+
+    def stats(self):
+        """Snapshot of pool gauges and counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+            })
+        return stats
+
+    def _open_new(self):
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._counters['connect_failures'] += 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._counters['created'] += 1
+        return PooledConnection(self, raw, time.monotonic())
+
+    def _is_healthy(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Pooled connection failed health check: {e}")
+            return False
+
+    def _evict_idle_locked(self, now):
+        # Oldest idle connections sit on the left
+        evicted = []
+        while self._idle and (now - self._idle[0][2] > self.max_idle
+                              or now - self._idle[0][1] > self.max_lifetime):
+            raw, created_at, last_used = self._idle.popleft()
+            reason = 'evicted_idle' if now - last_used > self.max_idle else 'recycled'
+            self._counters[reason] += 1
+            self._open -= 1
+            evicted.append(raw)
+        if evicted:
+            self._lock.notify(len(evicted))
+        return evicted
+
+    def _discard(self, raw, counter):
+        with self._lock:
+            self._open -= 1
+            if counter:
+                self._counters[counter] += 1
+            self._lock.notify()
+        self._close_all([raw])
+
+    @staticmethod
+    def _close_all(connections):
+        for raw in connections:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+
+# Driver errors from any backend - handled like the original pymysql.MySQLError
+DB_ERRORS = (pymysql.MySQLError, sqlite_compat.Error)
+
+
+def _in_transaction(conn):
+    return bool(conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+
+def _is_select(query):
+    return query.strip().upper().startswith('SELECT')
+
+
+class _SessionConnection:
+    """Hands the session connection to raw-cursor callers - close() leaves it with the session"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class Session:
+    """Unit of work - one pooled connection and one transaction for a whole request.
+
+    Outside a request (startup DDL, scripts) a session is one-shot: every
+    statement commits on its own and the connection goes straight back.
+    """
+
+    def __init__(self, database, transactional=True):
+        self._database = database
+        self.transactional = transactional
+        self._conn = None
+        self._read_conn = None
+        # After the first write every read goes to the primary (read-your-writes)
+        self.wrote = False
+        self.rollback_only = False
+        # Set when a statement failed, so callers can tell an error from an empty result
+        self.failed = False
+        self._after_commit = []
+
+    def connection(self):
+        """The session connection for callers that drive their own cursors"""
+        self.wrote = True
+        conn = self._acquire()
+        if conn is None:
+            return None
+        if self.transactional and not _in_transaction(conn):
+            conn.begin()
+        return _SessionConnection(conn)
+
+    def execute_query(self, query, params=None):
+        """Execute a query and return results"""
+        is_select = _is_select(query)
+        if is_select:
+            connection = self._acquire_read()
+        else:
+            self.wrote = True
+            connection = self._acquire()
+        if not connection:
+            logger.error("No database connection available")
+            self.failed = True
+            return None
+        try:
+            # Reads before the first write stay out of the transaction
+            if self.transactional and not is_select and not _in_transaction(connection):
+                connection.begin()
+
+            with connection.cursor() as cursor:
+                cursor.execute(query, params or ())
+
+                if is_select:
+                    result = cursor.fetchall()
+                else:
+                    if not self.transactional:
+                        connection.commit()
+                    result = cursor.lastrowid
+
+                logger.debug("✅ Query executed successfully: %s...", query[:50])
+                return result
+
+        except DB_ERRORS as e:
+            logger.error(f"❌ Error executing query: {e}")
+            self.failed = True
+            if not self.transactional:
+                connection.rollback()
+            return None
+        finally:
+            if not self.transactional:
+                self.close()
+
+    def execute_many(self, query, params_seq):
+        """Run one statement for many parameter rows and return the affected row count.
+
+        pymysql folds INSERT ... VALUES into a single multi-row statement, so a
+        whole document's lines cost one round trip.
+        """
+        params_seq = list(params_seq)
+        if not params_seq:
+            return 0
+        self.wrote = True
+        connection = self._acquire()
+        if not connection:
+            logger.error("No database connection available")
+            self.failed = True
+            return None
+        try:
+            if self.transactional and not _in_transaction(connection):
+                connection.begin()
+
+            with connection.cursor() as cursor:
+                cursor.executemany(query, params_seq)
+                if not self.transactional:
+                    connection.commit()
+                logger.debug("✅ Batch executed successfully (%s rows): %s...", len(params_seq), query.strip()[:50])
+                return cursor.rowcount
+
+        except DB_ERRORS as e:
+            logger.error(f"❌ Error executing batch: {e}")
+            self.failed = True
+            if not self.transactional:
+                connection.rollback()
+            return None
+        finally:
+            if not self.transactional:
+                self.close()
+
+    def after_commit(self, callback):
+        """Run callback once this session's writes are committed - straight away for one-shot sessions"""
+        if not self.transactional:
+            callback()
+        else:
+            self._after_commit.append(callback)
+
+    def commit(self):
+        if self._conn and _in_transaction(self._conn):
+            self._conn.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ After-commit callback failed: {e}")
+
+    def hand_over(self):
+        """Give an idle connection (no open transaction) to a caller that will close() it itself.
+
+        Lets a streamed read reuse the connection this request already holds
+        instead of taking a second pool slot. After a write only the primary
+        connection qualifies, and only once nothing is left to commit.
+        """
+        if self._read_conn is not None and not self.wrote:
+            conn, self._read_conn = self._read_conn, None
+            return conn
+        if self._conn is not None and not _in_transaction(self._conn):
+            conn, self._conn = self._conn, None
+            return conn
+        return None
+
+    def rollback(self):
+        if self._conn and _in_transaction(self._conn):
+            self._conn.rollback()
+        self._after_commit = []
+
+    def close(self):
+        """Give the connections back to their pools - anything uncommitted is rolled back there"""
+        self._after_commit = []
+        if self._read_conn:
+            conn, self._read_conn = self._read_conn, None
+            conn.close()
+        if self._conn:
+            conn, self._conn = self._conn, None
+            conn.close()
+
+    def _acquire(self):
+        if self._conn is None:
+            self._conn = self._database.checkout()
+        return self._conn
+
+    def _acquire_read(self):
+        """A replica connection for reads, or the primary once this session has written"""
+        if self.wrote or not self._database.has_replicas():
+            return self._acquire()
+        if self._read_conn is None:
+            self._read_conn = self._database.checkout_replica()
+        return self._read_conn or self._acquire()
+
+
+class MySQLBackend:
+    """Cloud SQL / MySQL over pymysql - the production engine"""
+
+    name = 'mysql'
+    stream_cursor = pymysql.cursors.SSDictCursor
+
+    def __init__(self, config):
+        self.config = config
+
+    def primary(self):
+        """(label, connect function) for the primary server"""
+        return f'primary {Config.CLOUD_SQL_CONNECTION_NAME}', lambda: pymysql.connect(**self.config)
+
+    def replica(self, address):
+        """(label, connect function) for a replica given as /unix/socket or host[:port]"""
+        args = dict(self.config)
+        args.pop('unix_socket', None)
+        if address.startswith('/'):
+            args['unix_socket'] = address
+        else:
+            host, _, port = address.partition(':')
+            args['host'] = host
+            args['port'] = int(port) if port else 3306
+        return f'replica {address}', lambda: pymysql.connect(**args)
+
+    def index_exists_query(self, table, name):
+        return ("SELECT 1 FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1", (table, name))
+
+
+class SQLiteBackend:
+    """Embedded SQLite (file or in-memory) for benchmarks and tests off App Engine.
+
+    Replica addresses are other SQLite databases, so read/write splitting can
+    be exercised locally with two files.
+    """
+
+    name = 'sqlite'
+    stream_cursor = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def primary(self):
+        return f'sqlite {self.path}', lambda: sqlite_compat.connect(self.path)
+
+    def replica(self, address):
+        return f'sqlite replica {address}', lambda: sqlite_compat.connect(address)
+
+    def index_exists_query(self, table, name):
+        # Index names are global in SQLite, so sqlite_compat prefixes them with the table
+        return "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s", (f'{table}_{name}',)
+
+
+def get_backend(config):
+    """The storage backend selected by Config.DB_BACKEND"""
+    if Config.DB_BACKEND == 'sqlite':
+        return SQLiteBackend(Config.SQLITE_PATH)
+    return MySQLBackend(config)
+
+
+class Endpoint:
+    """One database server with its own connection pool and circuit breaker"""
+
+    def __init__(self, name, connect, breaker=None):
+        self.name = name
+        self.connect = connect
+        self.breaker = breaker or CircuitBreaker(Config.DB_BREAKER_THRESHOLD, Config.DB_BREAKER_COOLDOWN)
+        self.pool = ConnectionPool(
+            connect=self._connect,
+            size=Config.DB_POOL_SIZE,
+            timeout=Config.DB_POOL_TIMEOUT,
+            max_idle=Config.DB_POOL_MAX_IDLE,
+            max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+            ping_interval=Config.DB_POOL_PING_INTERVAL
+        )
+
+    def _connect(self):
+        self.breaker.before_call()
+        logger.debug("🔗 Opening database connection: %s", self.name)
+        try:
+            conn = self.connect()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        logger.debug("✅ Database connection established successfully: %s", self.name)
+        return conn
+
+    def checkout(self):
+        """Pooled connection, or DatabaseUnavailable straight away while the breaker is open"""
+        if self.breaker.is_open():
+            raise DatabaseUnavailable(f"Database circuit open: {self.name}")
+        return self.pool.acquire()
+
+    def stats(self):
+        return {'name': self.name, 'breaker': self.breaker.stats(), 'pool': self.pool.stats()}
+
+
 class Database:
+    # One backend, primary and replica set per process, shared by every module-level Database() instance
+    backend = None
+    _primary = None
+    _replicas = None
+    _pool_lock = threading.Lock()
+    _next_replica = itertools.count()
+    breaker = CircuitBreaker(Config.DB_BREAKER_THRESHOLD, Config.DB_BREAKER_COOLDOWN)
+
     def __init__(self):
         self.config = {
             'user': Config.MYSQL_USER,
             'password': Config.MYSQL_PASSWORD,
             'database': Config.MYSQL_DATABASE,
+            'unix_socket': f'/cloudsql/{Config.CLOUD_SQL_CONNECTION_NAME}',
             'charset': 'utf8mb4',
             'cursorclass': pymysql.cursors.DictCursor,
             'autocommit': True,
             'connect_timeout': 10
         }
-        
-    def get_connection(self):
+
+    def _init_endpoints(self):
+        if Database._primary is None:
+            with Database._pool_lock:
+                if Database._primary is None:
+                    backend = get_backend(self.config)
+                    Database._replicas = [
+                        Endpoint(*backend.replica(address)) for address in Config.MYSQL_REPLICAS
+                    ]
+                    Database._primary = Endpoint(*backend.primary(), breaker=Database.breaker)
+                    Database.backend = backend
+                    logger.info(f"🗄️ Storage backend: {backend.name}")
+
+    def get_pool(self):
+        self._init_endpoints()
+        return Database._primary.pool
+
+    def pool_stats(self):
+        return self.get_pool().stats()
+
+    def replica_stats(self):
+        self._init_endpoints()
+        return [replica.stats() for replica in Database._replicas]
+
+    def has_replicas(self):
+        self._init_endpoints()
+        return bool(Database._replicas)
+
+    def checkout(self):
+        """Check a primary connection out of the pool - close() returns it"""
+        self._init_endpoints()
         try:
-            # Always try Cloud SQL connection
-            self.config['unix_socket'] = f'/cloudsql/{Config.CLOUD_SQL_CONNECTION_NAME}'
-            logger.info(f"🔗 Attempting Cloud SQL connection: {Config.CLOUD_SQL_CONNECTION_NAME}")
-            
-            conn = pymysql.connect(**self.config)
-            logger.info("✅ Database connection established successfully")
-            return conn
-            
+            return Database._primary.checkout()
+        except DatabaseUnavailable as e:
+            # Fail fast - no connect attempt, no waiting on the pool
+            logger.warning(f"⚠️ {e}")
+            if has_app_context():
+                g.db_unavailable = True
+            return None
         except Exception as e:
             logger.error(f"❌ Database connection failed: {e}")
-            logger.info("💡 This is expected on Windows. It will work on App Engine.")
+            if Database.backend.name == 'mysql':
+                logger.info("💡 Off App Engine, set DB_BACKEND=sqlite to run on an embedded database.")
             return None
 
+    def checkout_replica(self):
+        """A replica connection (round robin, skipping unhealthy ones), or None if all are down"""
+        self._init_endpoints()
+        replicas = Database._replicas
+        if not replicas:
+            return None
+        start = next(Database._next_replica)
+        for i in range(len(replicas)):
+            replica = replicas[(start + i) % len(replicas)]
+            try:
+                return replica.checkout()
+            except Exception as e:
+                logger.warning(f"⚠️ Skipping {replica.name}: {e}")
+        logger.warning("⚠️ No replica available - reading from the primary")
+        return None
+
+    def session(self):
+        """The current request's unit of work, or a one-shot session outside a request"""
+        if not has_app_context() or 'db_session' not in current_app.extensions:
+            return Session(self, transactional=False)
+        sess = g.get('db_session')
+        if sess is None:
+            sess = g.db_session = Session(self)
+        return sess
+
+    def get_connection(self):
+        """Connection for callers that drive their own cursors.
+
+        Inside a request this is the session connection (close() is a no-op),
+        otherwise a pooled connection that close() returns.
+        """
+        if has_app_context() and 'db_session' in current_app.extensions:
+            return self.session().connection()
+        return self.checkout()
+
     def __enter__(self):
         self.conn = self.get_connection()
         return self.conn
@@ -41,30 +691,165 @@ class Database:
             self.conn.close()
     def execute_query(self, query, params=None):
         """Execute a query and return results"""
-        connection = None
+        return self.session().execute_query(query, params)
+
+    def execute_many(self, query, params_seq):
+        """Execute one statement for many parameter rows in a single round trip"""
+        return self.session().execute_many(query, params_seq)
+
+    def has_index(self, table, name):
+        self._init_endpoints()
+        query, params = Database.backend.index_exists_query(table, name)
+        return bool(self.execute_query(query, params))
+
+    def ensure_index(self, table, name, columns, unique=False):
+        """Add an index to an existing table unless it is already there (CREATE TABLE IF NOT EXISTS won't)"""
+        if self.has_index(table, name):
+            return True
+        logger.info(f"🗂️ Adding {'unique ' if unique else ''}index {name} on {table} ({columns})")
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        return self.execute_query(f"CREATE {kind} {name} ON {table} ({columns})") is not None
+
+    def execute_stream(self, query, params=None, chunk_size=500):
+        """Yield rows one by one from an unbuffered server-side cursor.
+
+        Uses its own pooled connection (an unbuffered cursor ties up the
+        connection until the last row is read), so the request session stays
+        usable and peak memory is one chunk rather than the whole table.
+        An idle connection the request session already holds is taken over
+        rather than checking out a second one; the session gets a fresh one
+        if it needs it again. Reads from a replica unless this request has
+        already written.
+
+        The connection is checked out and the query run before this returns,
+        so no connection (PoolTimeout, DatabaseUnavailable) or a failing query
+        raises while the route can still answer 500/503 - not as an empty 200.
+        It also puts the statement in the request's X-Query-Count and budgets.
+        """
+        sess = g.get('db_session') if has_app_context() else None
+        connection = sess.hand_over() if sess is not None else None
+        if connection is None and not (sess is not None and sess.wrote):
+            connection = self.checkout_replica()
+        connection = connection or self._checkout_or_raise()
         try:
-            connection = self.get_connection()
-            if not connection:
-                logger.error("No database connection available")
-                return None
-                
-            with connection.cursor() as cursor:
-                cursor.execute(query, params or ())
-                
-                if query.strip().upper().startswith('SELECT'):
-                    result = cursor.fetchall()
-                else:
-                    connection.commit()
-                    result = cursor.lastrowid
-                    
-                logger.info(f"✅ Query executed successfully: {query[:50]}...")
-                return result
-                
-        except pymysql.MySQLError as e:
-            logger.error(f"❌ Error executing query: {e}")
-            if connection:
-                connection.rollback()
-            return None
-        finally:
-            if connection:
+            cursor = connection.cursor(Database.backend.stream_cursor)
+            cursor.execute(query, params or ())
+        except Exception:
+            connection.close()
+            raise
+        return RowStream(connection, cursor, chunk_size)
+
+    def _checkout_or_raise(self):
+        """Primary connection for callers that can't report a None - the failure is raised instead"""
+        self._init_endpoints()
+        try:
+            return Database._primary.checkout()
+        except DatabaseUnavailable as e:
+            logger.warning(f"⚠️ {e}")
+            if has_app_context():
+                g.db_unavailable = True
+            raise
+        except Exception as e:
+            logger.error(f"❌ Database connection failed: {e}")
+            raise
+
+
+class RowStream:
+    """Rows of an executed streaming cursor; the connection goes back after the last row or on close().
+
+    A body that is never iterated (the view failed afterwards, the client
+    left before the first chunk) still returns the connection when the
+    stream is garbage collected.
+    """
+
+    def __init__(self, connection, cursor, chunk_size):
+        self._connection = connection
+        self._cursor = cursor
+        self._chunk_size = chunk_size
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        for row in self._rows:
+            return row
+        if self._connection is None:
+            raise StopIteration
+        try:
+            chunk = self._cursor.fetchmany(self._chunk_size)
+        except DB_ERRORS as e:
+            # Headers are already sent - abort the body rather than end it cleanly
+            logger.error(f"❌ Error streaming query: {e}")
+            self.close()
+            raise
+        if not chunk:
+            self.close()
+            raise StopIteration
+        self._rows = iter(chunk)
+        return next(self._rows)
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                self._cursor.close()
+            finally:
                 connection.close()
+
+    def __del__(self):
+        self.close()
+
+
+def unavailable_response():
+    """503 telling the client the database is down and when to retry"""
+    response = jsonify({
+        'message': 'Database temporarily unavailable, please retry shortly',
+        'success': False
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(Database.breaker.retry_after())
+    return response
+
+
+def init_app(app):
+    """Bind a Session to every request: commit after the response, release at teardown"""
+    app.extensions['db_session'] = True
+
+    @app.before_request
+    def reject_while_circuit_open():
+        # Health and metrics must keep answering so the outage is visible
+        if request.path.startswith('/api/') and request.path not in ('/api/health', '/api/metrics') \
+                and Database.breaker.is_open():
+            return unavailable_response()
+
+    @app.errorhandler(DatabaseUnavailable)
+    def handle_database_unavailable(e):
+        return unavailable_response()
+
+    @app.after_request
+    def commit_db_session(response):
+        if response.status_code >= 500 and g.get('db_unavailable'):
+            # The handler only saw a missing connection - say why
+            response = unavailable_response()
+        sess = g.get('db_session')
+        if sess is None:
+            return response
+        if response.status_code >= 500 or sess.rollback_only:
+            # The pool rolls back whatever is still open on release
+            sess.close()
+            return response
+        try:
+            sess.commit()
+        except Exception as e:
+            logger.error(f"❌ Commit failed, rolling back request: {e}")
+            sess.close()
+            response = jsonify({'message': 'Database commit failed', 'success': False})
+            response.status_code = 500
+        return response
+
+    @app.teardown_appcontext
+    def close_db_session(exc):
+        sess = g.pop('db_session', None)
+        if sess is not None:
+            sess.close()
@@ -0,0 +1,233 @@
+# backend/hsn_index.py - in-process index over the hsn master table
+"""
+HSN.get_by_item_name used to run up to four LOWER(DESCRIPTION) LIKE scans
+per lookup. The table is small and almost never changes, so each instance
+keeps it in memory instead:
+
+- exact:    lowercased description -> first row id (hash)
+- prefix:   sorted (description, id) pairs searched with bisect
+- contains: trigram -> row ids (inverted index), candidates verified with `in`
+
+"First" means lowest id - the row an unordered LIMIT 1 returns from
+InnoDB. Every HSN_INDEX_REFRESH seconds a lookup probes COUNT(*), MAX(id)
+and a checksum of every row's contents. When only new ids were added they
+are appended in place; anything else (deletes, or an UPDATE of an existing
+code, description or rate, wherever it was made) triggers a reload.
+"""
+import bisect
+import logging
+import threading
+import time
+import zlib
+from backend.config import Config
+from backend.database import Database
+
+logger = logging.getLogger(__name__)
+db = Database()
+
+
+# One pass over a small table: an edit to any column of any row moves the checksum
+PROBE_QUERY = """
+    SELECT COUNT(*) AS n, MAX(id) AS max_id,
+           BIT_XOR(CRC32(CONCAT_WS('|', id, HSN_CODE, DESCRIPTION, GST_RATE))) AS checksum
+    FROM hsn
+"""
+
+
+def _crc32_row(row):
+    """PROBE_QUERY's per-row term, computed client side (CONCAT_WS skips NULLs)"""
+    values = (row['id'], row['HSN_CODE'], row.get('DESCRIPTION'), row.get('GST_RATE'))
+    return zlib.crc32('|'.join(str(value) for value in values if value is not None).encode())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _code_order(row):
+    return (row['HSN_CODE'], row['id'])
+
+
+def _code_row(row):
+    return {'HSN_CODE': row['HSN_CODE'], 'DESCRIPTION': row['DESCRIPTION']}
+
+
+class HSNIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self.loaded = False
+        self.checked_at = 0.0
+        # Bumped on every full load, so derived structures know to rebuild rather than append
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        self.rows = {}          # id -> row
+        self.lowered = {}       # id -> lowercased description
+        self.exact = {}         # lowercased description -> lowest id
+        self.prefix = []        # sorted (lowercased description, id)
+        self.grams = {}         # trigram -> set of ids
+        self.by_code = None     # rows sorted by HSN code, built on first use
+        self.max_id = 0
+        self.checksum = None    # PROBE_QUERY checksum the rows were loaded at
+
+    @property
+    def version(self):
+        """Changes whenever the indexed rows do (full reload or appended ids)"""
+        return f"{self.generation}.{self.max_id}"
+
+    # ----- loading -----
+    def load(self):
+        """(Re)build the whole index from the hsn table; False if the table can't be read"""
+        # Probed first: an edit that lands in between makes the next refresh reload again
+        probe = db.execute_query(PROBE_QUERY)
+        rows = db.execute_query("SELECT * FROM hsn ORDER BY id")
+        if rows is None or not probe:
+            return False
+        with self._lock:
+            self._reset()
+            self.checksum = probe[0]['checksum'] or 0
+            for row in rows:
+                self._add(row, bulk=True)
+            self.prefix.sort()
+            self.generation += 1
+            self.loaded = True
+            self.checked_at = time.monotonic()
+        logger.info(f"📚 HSN index loaded: {len(self.rows)} codes")
+        return True
+
+    def refresh(self):
+        """Pick up rows added since the last check; reload if rows went away or changed"""
+        result = db.execute_query(PROBE_QUERY)
+        if not result:
+            return False
+        count, max_id, checksum = result[0]['n'], result[0]['max_id'] or 0, result[0]['checksum'] or 0
+        with self._lock:
+            self.checked_at = time.monotonic()
+            if checksum == self.checksum and count == len(self.rows) and max_id == self.max_id:
+                return True
+            incremental = max_id > self.max_id and count > len(self.rows)
+            since, old_checksum = self.max_id, self.checksum
+        if not incremental:
+            return self.load()
+        rows = db.execute_query("SELECT * FROM hsn WHERE id > %s ORDER BY id", (since,))
+        if rows is None:
+            return False
+        # The checksum is an XOR over rows, so the new rows must account for the whole change
+        appended = old_checksum
+        for row in rows:
+            appended ^= _crc32_row(row)
+        if len(rows) + len(self.rows) != count or appended != checksum:
+            # Something else changed as well (a delete or an edit alongside the inserts)
+            return self.load()
+        with self._lock:
+            for row in rows:
+                self._add(row)
+            self.checksum = checksum
+        logger.debug('📚 HSN index: %s new codes', len(rows))
+        return True
+
+    def ensure_fresh(self):
+        """True when the index can answer lookups; loads or refreshes it when due"""
+        if self.loaded and time.monotonic() - self.checked_at < Config.HSN_INDEX_REFRESH:
+            return True
+        # One thread refreshes; the others keep answering from the current index
+        if not self._refresh_lock.acquire(blocking=not self.loaded):
+            return True
+        try:
+            if not self.loaded:
+                return self.load()
+            if time.monotonic() - self.checked_at >= Config.HSN_INDEX_REFRESH:
+                self.refresh()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ HSN index refresh failed: {e}")
+            return self.loaded
+        finally:
+            self._refresh_lock.release()
+
+    def invalidate(self):
+        """Force a check against the table on the next lookup"""
+        self.checked_at = 0.0
+
+    def _add(self, row, bulk=False):
+        row_id = row['id']
+        if row_id in self.rows:
+            return
+        self.rows[row_id] = dict(row)
+        self.by_code = None
+        self.max_id = max(self.max_id, row_id)
+        description = (row.get('DESCRIPTION') or '').lower()
+        self.lowered[row_id] = description
+        if not description:
+            return
+        if description not in self.exact or row_id < self.exact[description]:
+            self.exact[description] = row_id
+        if bulk:
+            self.prefix.append((description, row_id))  # load() sorts once at the end
+        else:
+            bisect.insort(self.prefix, (description, row_id))
+        for gram in trigrams(description):
+            self.grams.setdefault(gram, set()).add(row_id)
+
+    # ----- lookups (callers pass lowercased text) -----
+    def _contains_ids(self, text):
+        """Ids whose description contains text"""
+        grams = trigrams(text)
+        if not grams:
+            # Too short for trigrams - check every description
+            return [i for i, description in self.lowered.items() if text in description]
+        postings = sorted((self.grams.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return [i for i in candidates if text in self.lowered[i]]
+
+    def _first_prefix_id(self, text):
+        start = bisect.bisect_left(self.prefix, (text,))
+        ids = []
+        for description, row_id in self.prefix[start:]:
+            if not description.startswith(text):
+                break
+            ids.append(row_id)
+        return min(ids) if ids else None
+
+    def match(self, text):
+        """Same priority as the old SQL: exact, contains, word, starts-with - first row wins"""
+        with self._lock:
+            row_id = self.exact.get(text)
+            if row_id is None:
+                ids = self._contains_ids(text)
+                row_id = min(ids) if ids else None
+            if row_id is None:
+                ids = self._contains_ids(f' {text} ')
+                row_id = min(ids) if ids else None
+            if row_id is None:
+                row_id = self._first_prefix_id(text)
+            return dict(self.rows[row_id]) if row_id is not None else None
+
+    def search(self, text, limit=10):
+        """Rows whose description contains text, by HSN code"""
+        with self._lock:
+            rows = [self.rows[i] for i in self._contains_ids(text)]
+        rows.sort(key=_code_order)
+        return [_code_row(row) for row in rows[:limit]]
+
+    def first_codes(self, limit=100):
+        """The first rows by HSN code, as the dropdown lists them"""
+        with self._lock:
+            if self.by_code is None:
+                self.by_code = sorted(self.rows.values(), key=_code_order)
+            rows = self.by_code[:limit]
+        return [_code_row(row) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'codes': len(self.rows),
+                'trigrams': len(self.grams),
+                'max_id': self.max_id,
+            }
+
+
+hsn_index = HSNIndex()
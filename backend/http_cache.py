@@ -0,0 +1,57 @@
+# backend/http_cache.py - conditional GET for list and detail endpoints
+"""
+ETags come from the per-table generations in CacheManager, which every
+committed write moves on. A client that sends back the ETag it was given
+gets a 304 without the view (or its query) running at all.
+
+The tag is read before the view runs, so a write that lands mid-request
+can only make the tag older than the body - the next request gets a 200.
+"""
+from functools import wraps
+from flask import Response, make_response, request
+from backend.cache_manager import CacheManager
+from backend.config import Config
+from backend.streaming import body_format
+
+
+def etag_for(tables):
+    """ETag for the current request's representation, or None if a generation is unknown"""
+    versions = [CacheManager.get_generation(table) for table in tables]
+    if None in versions:
+        return None
+    # JSON and NDJSON bodies of the same data are different representations
+    return '-'.join([body_format()] + [f'{t}.{v}' for t, v in zip(tables, versions)])
+
+
+def cache_control():
+    if Config.HTTP_CACHE_MAX_AGE:
+        return f'private, max-age={Config.HTTP_CACHE_MAX_AGE}'
+    # Let the browser keep the body but check back every time - that check is the cheap 304
+    return 'private, no-cache'
+
+
+def conditional(*tables):
+    """Answer If-None-Match for GET from the generations of the tables the view reads.
+
+    The ETag names the body format, and responses carry Vary: Accept, so a JSON
+    tag never validates an NDJSON body or the other way round.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            etag = etag_for(tables)
+            if etag and request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if not etag or response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control()
+            # Accept picks JSON or NDJSON for the same URL - a shared cache must key on it too
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
@@ -1,8 +1,11 @@
 from flask import Blueprint, request, jsonify
 from backend.database import Database
+from backend.streaming import stream_rows
+from backend.cache_manager import CacheManager
+from backend.http_cache import conditional
+from backend.stock import InsufficientStock, StockMovement, line_quantity
 from datetime import datetime
 import logging
-import traceback
 
 invoice_bp = Blueprint('invoice', __name__)
 logger = logging.getLogger(__name__)
@@ -64,7 +67,41 @@ def save_invoice():
         cursor.close()
         conn.close()
 
+INVOICE_ITEM_INSERT = """
+    INSERT INTO invoice_items 
+    (invoice_id, item_id, item_name, hsn_code, quantity, 
+     unit_price, discount, tax_rate, total_price)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+def insufficient_stock_response(error):
+    """409 for a movement refused under STOCK_STRICT - same issue rows as /invoices/check-stock"""
+    logger.warning('❌ %s', error)
+    return jsonify({
+        'message': 'Insufficient stock',
+        'stock_issues': error.shortages,
+        'success': False
+    }), 409
+
+def invoice_item_rows(invoice_id, items):
+    """Parameter rows for INVOICE_ITEM_INSERT, one per invoice line"""
+    return [
+        (
+            invoice_id,
+            item.get('item_id'),
+            item.get('item_name', 'Unknown Item'),
+            item.get('hsn_code', ''),
+            line_quantity(item),
+            item.get('unit_price', 0),
+            item.get('discount', 0),
+            item.get('tax_rate', 0),
+            item.get('total_price', 0)
+        )
+        for item in items
+    ]
+
 @invoice_bp.route('/invoices', methods=['GET', 'POST', 'OPTIONS'])
+@conditional('invoices', 'customers')
 def handle_invoices():
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'}), 200
@@ -77,12 +114,7 @@ def handle_invoices():
                 LEFT JOIN customers c ON i.customer_id = c.id 
                 ORDER BY i.created_date DESC
             """
-            invoices = db.execute_query(query)
-            return jsonify({
-                'invoices': invoices or [],
-                'count': len(invoices) if invoices else 0,
-                'success': True
-            }), 200
+            return stream_rows(db.execute_stream(query), 'invoices'), 200
         except Exception as e:
             logger.error(f"Error fetching invoices: {e}")
             return jsonify({'message': 'Error fetching invoices', 'success': False}), 500
@@ -90,11 +122,8 @@ def handle_invoices():
     elif request.method == 'POST':
         try:
             data = request.get_json()
-            print("\n" + "=" * 80)
-            print("🧾 POST /invoices - CREATE NEW INVOICE")
-            print("=" * 80)
-            print(f"Received data: {data}")
-            print("=" * 80)
+            logger.debug('🧾 POST /invoices - CREATE NEW INVOICE')
+            logger.debug('Received data: %s', data)
 
             # Validate required fields
             required_fields = ['invoice_number', 'customer_id', 'invoice_date', 'items']
@@ -102,11 +131,11 @@ def handle_invoices():
             
             if missing_fields:
                 error_msg = f'Missing required fields: {", ".join(missing_fields)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
             connection = db.get_connection()
-            cursor = connection.cursor(dictionary=True)
+            cursor = connection.cursor()
             
             try:
                 # Insert invoice
@@ -131,84 +160,35 @@ def handle_invoices():
                 cursor.execute(invoice_query, invoice_params)
                 invoice_id = cursor.lastrowid
                 
-                # Insert invoice items and update stock if finalized
-                stock_updates = []
+                # Insert invoice items - all lines in one multi-row INSERT
                 if data['items']:
-                    for item in data['items']:
-                        # Insert invoice item
-                        item_query = """
-                            INSERT INTO invoice_items 
-                            (invoice_id, item_id, item_name, hsn_code, quantity, 
-                             unit_price, discount, tax_rate, total_price)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        item_params = (
-                            invoice_id,
-                            item.get('item_id'),
-                            item.get('item_name', 'Unknown Item'),
-                            item.get('hsn_code', ''),
-                            item.get('quantity', 1),
-                            item.get('unit_price', 0),
-                            item.get('discount', 0),
-                            item.get('tax_rate', 0),
-                            item.get('total_price', 0)
-                        )
-                        cursor.execute(item_query, item_params)
-                        
-                        # Store stock updates if invoice is finalized
-                        if data.get('status') == 'Finalized' and item.get('item_id'):
-                            stock_updates.append({
-                                'item_id': item['item_id'],
-                                'quantity': item['quantity'],
-                                'item_name': item.get('item_name', 'Unknown Item')
-                            })
-                
-                # Process stock updates for finalized invoices
-                if data.get('status') == 'Finalized' and stock_updates:
-                    print(f"📦 Processing stock reduction for {len(stock_updates)} items")
-                    for stock_update in stock_updates:
-                        try:
-                            # Check current stock first
-                            cursor.execute("SELECT stock, name FROM items WHERE id = %s", (stock_update['item_id'],))
-                            item_data = cursor.fetchone()
-                            
-                            if item_data:
-                                current_stock = item_data['stock']
-                                new_stock = current_stock - stock_update['quantity']
-                                
-                                if new_stock < 0:
-                                    print(f"⚠️ Warning: Stock would go negative for item {stock_update['item_id']}. Setting to 0.")
-                                    new_stock = 0
-                                
-                                # Update stock
-                                update_stock_query = """
-                                    UPDATE items 
-                                    SET stock = %s 
-                                    WHERE id = %s
-                                """
-                                cursor.execute(update_stock_query, (new_stock, stock_update['item_id']))
-                                
-                                print(f"✅ Stock updated: {item_data['name']} ({stock_update['item_id']}) - {current_stock} → {new_stock} (reduced by {stock_update['quantity']})")
-                            else:
-                                print(f"❌ Item not found for stock update: {stock_update['item_id']}")
-                                
-                        except Exception as stock_error:
-                            print(f"⚠️ Stock update failed for item {stock_update['item_id']}: {stock_error}")
-                            # Continue with other stock updates even if one fails
+                    cursor.executemany(INVOICE_ITEM_INSERT, invoice_item_rows(invoice_id, data['items']))
+
+                # A finalized invoice takes its lines out of stock
+                stock_movements = []
+                if data.get('status') == 'Finalized':
+                    stock_movements = StockMovement.apply(cursor, data['items'])
                 
+                CacheManager.touch('invoices')
+                if stock_movements:
+                    CacheManager.clear_items_cache()
                 connection.commit()
-                print(f"✅ Invoice created successfully with ID: {invoice_id}")
+                logger.debug('✅ Invoice created successfully with ID: %s', invoice_id)
                 
                 return jsonify({
                     'message': 'Invoice created successfully',
                     'id': invoice_id,
                     'success': True,
-                    'stock_updated': len(stock_updates) if data.get('status') == 'Finalized' else 0
+                    'stock_updated': StockMovement.moved(stock_movements),
+                    'stock_movements': stock_movements
                 }), 201
                 
+            except InsufficientStock as e:
+                connection.rollback()
+                return insufficient_stock_response(e)
             except Exception as e:
                 connection.rollback()
-                print(f"💥 Database error: {e}")
+                logger.error('💥 Database error: %s', e)
                 raise e
             finally:
                 cursor.close()
@@ -216,11 +196,11 @@ def handle_invoices():
                 
         except Exception as e:
             logger.error(f"Error creating invoice: {e}")
-            print(f"💥 EXCEPTION in POST /invoices:")
-            traceback.print_exc()
+            logger.exception('💥 EXCEPTION in POST /invoices:')
             return jsonify({'message': f'Server error: {str(e)}', 'success': False}), 500
 
 @invoice_bp.route('/invoices/<int:invoice_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('invoices', 'customers', 'items')
 def handle_invoice(invoice_id):
     if request.method == 'GET':
         try:
@@ -257,8 +237,8 @@ def handle_invoice(invoice_id):
     elif request.method == 'PUT':
         try:
             data = request.get_json()
-            print(f"📝 PUT /invoices/{invoice_id} - UPDATE INVOICE")
-            print(f"Received data: {data}")
+            logger.debug('📝 PUT /invoices/%s - UPDATE INVOICE', invoice_id)
+            logger.debug('Received data: %s', data)
 
             # Validate required fields
             required_fields = ['invoice_number', 'customer_id', 'invoice_date', 'items']
@@ -266,11 +246,11 @@ def handle_invoice(invoice_id):
             
             if missing_fields:
                 error_msg = f'Missing required fields: {", ".join(missing_fields)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
             connection = db.get_connection()
-            cursor = connection.cursor(dictionary=True)
+            cursor = connection.cursor()
             
             try:
                 # First check if invoice exists and get current status
@@ -308,84 +288,35 @@ def handle_invoice(invoice_id):
                 # Delete existing items and insert new ones
                 cursor.execute("DELETE FROM invoice_items WHERE invoice_id = %s", (invoice_id,))
                 
-                # Insert invoice items and handle stock updates
-                stock_updates = []
+                # Insert invoice items - all lines in one multi-row INSERT
                 if data['items']:
-                    for item in data['items']:
-                        # Insert invoice item
-                        item_query = """
-                            INSERT INTO invoice_items 
-                            (invoice_id, item_id, item_name, hsn_code, quantity, 
-                             unit_price, discount, tax_rate, total_price)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        item_params = (
-                            invoice_id,
-                            item.get('item_id'),
-                            item.get('item_name', 'Unknown Item'),
-                            item.get('hsn_code', ''),
-                            item.get('quantity', 1),
-                            item.get('unit_price', 0),
-                            item.get('discount', 0),
-                            item.get('tax_rate', 0),
-                            item.get('total_price', 0)
-                        )
-                        cursor.execute(item_query, item_params)
-                        
-                        # Store stock updates if changing from Draft to Finalized
-                        if previous_status != 'Finalized' and new_status == 'Finalized' and item.get('item_id'):
-                            stock_updates.append({
-                                'item_id': item['item_id'],
-                                'quantity': item['quantity'],
-                                'item_name': item.get('item_name', 'Unknown Item')
-                            })
-                
-                # Process stock updates for status change to Finalized
-                if previous_status != 'Finalized' and new_status == 'Finalized' and stock_updates:
-                    print(f"📦 Processing stock reduction for {len(stock_updates)} items")
-                    for stock_update in stock_updates:
-                        try:
-                            # Check current stock first
-                            cursor.execute("SELECT stock, name FROM items WHERE id = %s", (stock_update['item_id'],))
-                            item_data = cursor.fetchone()
-                            
-                            if item_data:
-                                current_stock = item_data['stock']
-                                new_stock = current_stock - stock_update['quantity']
-                                
-                                if new_stock < 0:
-                                    print(f"⚠️ Warning: Stock would go negative for item {stock_update['item_id']}. Setting to 0.")
-                                    new_stock = 0
-                                
-                                # Update stock
-                                update_stock_query = """
-                                    UPDATE items 
-                                    SET stock = %s 
-                                    WHERE id = %s
-                                """
-                                cursor.execute(update_stock_query, (new_stock, stock_update['item_id']))
-                                
-                                print(f"✅ Stock updated: {item_data['name']} ({stock_update['item_id']}) - {current_stock} → {new_stock} (reduced by {stock_update['quantity']})")
-                            else:
-                                print(f"❌ Item not found for stock update: {stock_update['item_id']}")
-                                
-                        except Exception as stock_error:
-                            print(f"⚠️ Stock update failed for item {stock_update['item_id']}: {stock_error}")
-                            # Continue with other stock updates even if one fails
+                    cursor.executemany(INVOICE_ITEM_INSERT, invoice_item_rows(invoice_id, data['items']))
+
+                # Going from Draft to Finalized takes the lines out of stock
+                stock_movements = []
+                if previous_status != 'Finalized' and new_status == 'Finalized':
+                    stock_movements = StockMovement.apply(cursor, data['items'])
                 
+                CacheManager.touch('invoices')
+                if stock_movements:
+                    CacheManager.clear_items_cache()
                 connection.commit()
-                print(f"✅ Invoice {invoice_id} updated successfully")
+                logger.debug('✅ Invoice %s updated successfully', invoice_id)
                 
                 return jsonify({
                     'message': 'Invoice updated successfully',
                     'id': invoice_id,
                     'success': True,
-                    'stock_updated': len(stock_updates) if previous_status != 'Finalized' and new_status == 'Finalized' else 0
+                    'stock_updated': StockMovement.moved(stock_movements),
+                    'stock_movements': stock_movements
                 }), 200
                 
+            except InsufficientStock as e:
+                connection.rollback()
+                return insufficient_stock_response(e)
             except Exception as e:
                 connection.rollback()
-                print(f"💥 Database error in PUT: {e}")
+                logger.error('💥 Database error in PUT: %s', e)
                 raise e
             finally:
                 cursor.close()
@@ -393,55 +324,36 @@ def handle_invoice(invoice_id):
                 
         except Exception as e:
             logger.error(f"Error updating invoice: {e}")
-            print(f"💥 EXCEPTION in PUT /invoices/{invoice_id}:")
-            traceback.print_exc()
+            logger.exception('💥 EXCEPTION in PUT /invoices/%s:', invoice_id)
             return jsonify({'message': f'Server error: {str(e)}', 'success': False}), 500
 
     elif request.method == 'DELETE':
         try:
             connection = db.get_connection()
-            cursor = connection.cursor(dictionary=True)
+            cursor = connection.cursor()
             
             try:
                 # Get invoice details to restore stock if finalized
                 cursor.execute("SELECT status FROM invoices WHERE id = %s", (invoice_id,))
                 invoice = cursor.fetchone()
                 
-                stock_restored = 0
+                stock_movements = []
                 if invoice and invoice['status'] == 'Finalized':
-                    # Get invoice items to restore stock
+                    # Put the invoice's lines back into stock
                     cursor.execute("""
                         SELECT item_id, quantity FROM invoice_items 
                         WHERE invoice_id = %s
                     """, (invoice_id,))
-                    items = cursor.fetchall()
-                    
-                    for item in items:
-                        try:
-                            # Check current stock
-                            cursor.execute("SELECT stock, name FROM items WHERE id = %s", (item['item_id'],))
-                            item_data = cursor.fetchone()
-                            
-                            if item_data:
-                                current_stock = item_data['stock']
-                                new_stock = current_stock + item['quantity']
-                                
-                                # Restore stock
-                                cursor.execute("""
-                                    UPDATE items SET stock = %s WHERE id = %s
-                                """, (new_stock, item['item_id']))
-                                
-                                print(f"✅ Stock restored: {item_data['name']} ({item['item_id']}) - {current_stock} → {new_stock} (added {item['quantity']})")
-                                stock_restored += 1
-                                
-                        except Exception as stock_error:
-                            print(f"⚠️ Stock restoration failed for item {item['item_id']}: {stock_error}")
-                            continue
+                    stock_movements = StockMovement.apply(cursor, cursor.fetchall(), restore=True)
+                stock_restored = StockMovement.moved(stock_movements)
                 
                 # Delete invoice items and invoice
                 cursor.execute("DELETE FROM invoice_items WHERE invoice_id = %s", (invoice_id,))
                 cursor.execute("DELETE FROM invoices WHERE id = %s", (invoice_id,))
                 
+                CacheManager.touch('invoices')
+                if stock_restored:
+                    CacheManager.clear_items_cache()
                 connection.commit()
                 
                 message = 'Invoice deleted successfully'
@@ -451,7 +363,8 @@ def handle_invoice(invoice_id):
                 return jsonify({
                     'message': message,
                     'success': True,
-                    'stock_restored': stock_restored
+                    'stock_restored': stock_restored,
+                    'stock_movements': stock_movements
                 }), 200
                 
             except Exception as e:
@@ -469,7 +382,7 @@ def handle_invoice(invoice_id):
 def finalize_invoice(invoice_id):
     try:
         connection = db.get_connection()
-        cursor = connection.cursor(dictionary=True)
+        cursor = connection.cursor()
         
         try:
             # First check if invoice exists and get current status
@@ -491,47 +404,23 @@ def finalize_invoice(invoice_id):
                 """, (invoice_id,))
                 items = cursor.fetchall()
                 
-                stock_updated = 0
-                for item in items:
-                    try:
-                        # Check current stock first
-                        cursor.execute("SELECT stock, name, code FROM items WHERE id = %s", (item['item_id'],))
-                        item_data = cursor.fetchone()
-                        
-                        if item_data:
-                            current_stock = item_data['stock']
-                            new_stock = current_stock - item['quantity']
-                            
-                            # Prevent negative stock
-                            if new_stock < 0:
-                                print(f"⚠️ Warning: Stock would go negative for {item_data['name']}. Setting to 0.")
-                                new_stock = 0
-                            
-                            # Update stock
-                            cursor.execute("""
-                                UPDATE items 
-                                SET stock = %s 
-                                WHERE id = %s
-                            """, (new_stock, item['item_id']))
-                            
-                            print(f"✅ Stock reduced: {item_data['code']} - {item_data['name']} - {current_stock} → {new_stock} (reduced by {item['quantity']})")
-                            stock_updated += 1
-                        else:
-                            print(f"❌ Item not found for stock update: {item['item_id']}")
-                            
-                    except Exception as stock_error:
-                        print(f"⚠️ Stock update failed for item {item['item_id']}: {stock_error}")
-                        # Continue with other stock updates even if one fails
+                stock_movements = StockMovement.apply(cursor, items)
+                stock_updated = StockMovement.moved(stock_movements)
                 
+                CacheManager.touch('invoices', 'items')
                 connection.commit()
                 return jsonify({
                     'message': f'Invoice finalized and stock updated for {stock_updated} items',
                     'success': True,
-                    'stock_updated': stock_updated
+                    'stock_updated': stock_updated,
+                    'stock_movements': stock_movements
                 }), 200
             else:
                 return jsonify({'message': 'Invoice is already finalized', 'success': True}), 200
             
+        except InsufficientStock as e:
+            connection.rollback()
+            return insufficient_stock_response(e)
         except Exception as e:
             connection.rollback()
             raise e
@@ -551,29 +440,9 @@ def check_stock_availability():
         data = request.get_json()
         items = data.get('items', [])
         
-        stock_issues = []
-        sufficient_stock = True
-        
-        for item in items:
-            if item.get('item_id'):
-                # Check current stock
-                query = "SELECT id, code, name, stock FROM items WHERE id = %s"
-                result = db.execute_query(query, (item['item_id'],))
-                
-                if result:
-                    current_stock = result[0]['stock']
-                    required_quantity = item.get('quantity', 0)
-                    
-                    if current_stock < required_quantity:
-                        sufficient_stock = False
-                        stock_issues.append({
-                            'item_id': item['item_id'],
-                            'item_code': result[0]['code'],
-                            'item_name': result[0]['name'],
-                            'available_stock': current_stock,
-                            'required_quantity': required_quantity,
-                            'shortage': required_quantity - current_stock
-                        })
+        # Lines for the same item add up; one query for all of them
+        stock_issues = StockMovement.check(items)
+        sufficient_stock = not stock_issues
         
         return jsonify({
             'sufficient_stock': sufficient_stock,
@@ -589,4 +458,4 @@ def check_stock_availability():
 def register_invoice_routes(app):
     """Registers invoice routes with the Flask app."""
     app.register_blueprint(invoice_bp, url_prefix='/api')
-    print("✅ Invoice routes registered successfully")
\ No newline at end of file
+    logger.info('✅ Invoice routes registered successfully')
\ No newline at end of file
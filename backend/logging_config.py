@@ -0,0 +1,74 @@
+# backend/logging_config.py - queue-backed, level-gated logging
+"""
+Request threads never write log output themselves: the root logger has a
+single QueueHandler, and a QueueListener thread drains the queue into the
+real stream handler. Levels come from Config (LOG_LEVEL, plus per-logger
+overrides in LOG_LEVELS), so anything below the level costs one
+isEnabledFor() check. DEBUG records can additionally be sampled with
+LOG_DEBUG_SAMPLE_RATE when tracing a busy instance.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+from backend.config import Config
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+_listener = None
+
+
+class DebugSampler(logging.Filter):
+    """Pass a random fraction of DEBUG records; INFO and above always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+def _level(name):
+    level = logging.getLevelName(str(name).upper())
+    return level if isinstance(level, int) else logging.WARNING
+
+
+def setup_logging(level=None):
+    """Install the queue handler on the root logger and start the writer thread (once)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger()
+    root.setLevel(_level(level or Config.LOG_LEVEL))
+    for name, module_level in Config.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(_level(module_level))
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Sample before the record is formatted and queued
+    queue_handler.addFilter(DebugSampler(Config.LOG_DEBUG_SAMPLE_RATE))
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued when the worker exits
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
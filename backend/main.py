@@ -4,7 +4,8 @@ from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 
 # Configure logging first
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+from backend.logging_config import setup_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -31,8 +32,13 @@ def serve_static(path):
 
 # Initialize database connection
 try:
-    from backend.database import Database
+    from backend.database import Database, init_app as init_database
+    from backend.query_stats import init_app as init_query_tracking
     from backend.config import Config
+    init_database(app)
+    init_query_tracking(app)
+    from backend.cache_manager import CacheManager, init_app as init_cache
+    init_cache(app)
     logger.info("✅ Database modules imported successfully")
 except ImportError as e:
     logger.error(f"❌ Database modules import failed: {e}")
@@ -70,15 +76,19 @@ except ImportError as e:
 def initialize_database_tables():
     """Initialize database tables safely"""
     try:
-        from backend.models import Item
+        from backend.models import Item, HSN
         from backend.customer_model import Customer
         from backend.quotation_invoice_models import QuotationInvoiceModels
         
         logger.info("🔄 Initializing database tables...")
         Customer.create_tables()
+        HSN.create_tables()
         Item.create_tables()
         QuotationInvoiceModels.create_tables()
         logger.info("✅ All tables initialized successfully")
+        # Warm the in-memory HSN index so the first auto-fill doesn't pay for it
+        from backend.hsn_index import hsn_index
+        hsn_index.load()
     except Exception as e:
         logger.error(f"❌ Table initialization failed: {e}")
 
@@ -123,6 +133,7 @@ def debug_customer_test():
         )
         result = db.execute_query(query, params)
         if result is not None:
+            CacheManager.touch('customers')
             return jsonify({
                 "message": "Customer inserted into Cloud SQL",
                 "id": result,
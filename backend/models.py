@@ -1,8 +1,192 @@
 from datetime import datetime
+from backend.config import Config
 from backend.database import Database
+from backend.hsn_index import hsn_index, trigrams
+from backend.cache_manager import local_cache
+from backend.bom import bom
+from collections import Counter
+import base64
+import bisect
+import heapq
+import json
+import logging
+import math
+import re
+import threading
 
+logger = logging.getLogger(__name__)
 db = Database()
 
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset({'a', 'an', 'and', 'etc', 'for', 'in', 'of', 'or', 'other', 'others', 'the', 'to', 'with'})
+
+
+def normalize_tokens(text):
+    """Lowercased word tokens without stopwords, crude plurals folded ('bolts' -> 'bolt')"""
+    tokens = []
+    for token in _TOKEN.findall((text or '').lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class HSNMatcher:
+    """Ranks HSN descriptions against an item name.
+
+    score = 0.7 * IDF-weighted token cosine + 0.3 * trigram Dice. Token
+    order doesn't matter ('bolt hex' == 'hex bolt'), trigrams absorb typos,
+    and the last query token also matches as a prefix for as-you-type
+    lookups. Per-description token vectors and trigram sets are built once
+    from hsn_index and rebuilt only when the index changes.
+    """
+
+    TOKEN_WEIGHT = 0.7
+    PREFIX_EXPANSION = 20
+
+    def __init__(self, index):
+        self.index = index
+        self._lock = threading.Lock()
+        self._generation = None
+        self._reset()
+
+    def _reset(self):
+        self.tokens = {}        # id -> token set
+        self.grams = {}         # id -> trigram set of the normalized description
+        self.vectors = {}       # id -> {token: weight}, unit length
+        self.postings = {}      # token -> set of ids
+        self.gram_postings = {} # trigram -> set of ids
+        self.idf = {}
+        self.vocabulary = []    # sorted tokens, for prefix expansion
+        self.max_id = 0
+
+    def _sync(self):
+        index = self.index
+        if self._generation == index.generation and self.max_id == index.max_id:
+            return
+        with self._lock:
+            if self._generation != index.generation:
+                self._reset()
+                self._generation = index.generation
+            new_rows = [row for row_id, row in list(index.rows.items()) if row_id > self.max_id]
+            for row in new_rows:
+                tokens = normalize_tokens(row.get('DESCRIPTION'))
+                self.tokens[row['id']] = set(tokens)
+                self.grams[row['id']] = trigrams(f" {' '.join(tokens)} ")
+                for gram in self.grams[row['id']]:
+                    self.gram_postings.setdefault(gram, set()).add(row['id'])
+                for token in tokens:
+                    self.postings.setdefault(token, set()).add(row['id'])
+                self.max_id = max(self.max_id, row['id'])
+            # Document frequencies moved - reweight every vector (the table rarely changes)
+            total = len(self.tokens) or 1
+            self.idf = {token: math.log(1 + total / len(ids)) for token, ids in self.postings.items()}
+            self.vocabulary = sorted(self.postings)
+            self.vectors = {row_id: self._vector(tokens) for row_id, tokens in self.tokens.items()}
+
+    def _vector(self, tokens, unknown_idf=None):
+        weights = {token: self.idf.get(token, unknown_idf or 0.0) for token in tokens}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {token: w / norm for token, w in weights.items()}
+
+    def _expand_prefix(self, token):
+        start = bisect.bisect_left(self.vocabulary, token)
+        expanded = []
+        for candidate in self.vocabulary[start:start + self.PREFIX_EXPANSION]:
+            if not candidate.startswith(token):
+                break
+            expanded.append(candidate)
+        return expanded
+
+    def _query(self, tokens):
+        """Query vector plus prefix expansions for a still-being-typed last token (lock held)"""
+        max_idf = max(self.idf.values(), default=1.0)
+        query = self._vector(set(tokens), unknown_idf=max_idf)
+        expansions = {}
+        last = tokens[-1]
+        if last not in self.postings:
+            expansions[last] = set(self._expand_prefix(last))
+        return query, expansions
+
+    def _cosines(self, query, expansions):
+        """Token cosine for every description sharing a token, accumulated term-at-a-time"""
+        cosines = {}
+        for token, weight in query.items():
+            for row_id in self.postings.get(token, ()):
+                cosines[row_id] = cosines.get(row_id, 0.0) + weight * self.vectors[row_id][token]
+            if token in expansions:
+                # A prefix counts once per description, via its best-weighted completion
+                best = {}
+                for expanded in expansions[token]:
+                    for row_id in self.postings[expanded]:
+                        best[row_id] = max(best.get(row_id, 0.0), self.vectors[row_id][expanded])
+                for row_id, value in best.items():
+                    cosines[row_id] = cosines.get(row_id, 0.0) + weight * value
+        return cosines
+
+    def _dice(self, row_id, query_grams):
+        grams = self.grams[row_id]
+        return 2 * len(query_grams & grams) / (len(query_grams) + len(grams))
+
+    def rank(self, text, limit=5):
+        """Top `limit` (row, score) pairs for text, best first"""
+        self._sync()
+        tokens = normalize_tokens(text)
+        if not tokens:
+            return []
+        query_grams = trigrams(f" {' '.join(tokens)} ")
+        with self._lock:
+            query, expansions = self._query(tokens)
+            cosines = self._cosines(query, expansions)
+            if len(cosines) < limit:
+                # Nothing (or little) shares a whole word - fall back to shared trigrams
+                overlap = Counter()
+                for gram in query_grams:
+                    overlap.update(self.gram_postings.get(gram, ()))
+                for row_id, _ in overlap.most_common(limit * 20):
+                    cosines.setdefault(row_id, 0.0)
+
+            # Trigram Dice adds at most (1 - TOKEN_WEIGHT), so once a candidate's
+            # cosine can't beat the current k-th score the rest can be skipped
+            best = []
+            for row_id, cosine in sorted(cosines.items(), key=lambda item: (-item[1], item[0])):
+                bound = self.TOKEN_WEIGHT * cosine + (1 - self.TOKEN_WEIGHT)
+                if len(best) == limit and bound < best[0][0]:
+                    break
+                score = self.TOKEN_WEIGHT * cosine + (1 - self.TOKEN_WEIGHT) * self._dice(row_id, query_grams)
+                # Lower id breaks ties, like the old LIMIT 1
+                entry = (score, -row_id)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            best.sort(reverse=True)
+        rows = self.index.rows
+        return [(dict(rows[-neg_id]), round(score, 4)) for score, neg_id in best if -neg_id in rows]
+
+    def score(self, text, row_id):
+        """Similarity of one description to text, on the same scale as rank()"""
+        self._sync()
+        tokens = normalize_tokens(text)
+        if not tokens or row_id not in self.vectors:
+            return 0.0
+        query_grams = trigrams(f" {' '.join(tokens)} ")
+        with self._lock:
+            query, expansions = self._query(tokens)
+            vector = self.vectors[row_id]
+            cosine = sum(weight * vector[token] for token, weight in query.items() if token in vector)
+            for token, completions in expansions.items():
+                matched = completions & vector.keys()
+                if matched:
+                    cosine += query[token] * max(vector[m] for m in matched)
+            score = self.TOKEN_WEIGHT * cosine + (1 - self.TOKEN_WEIGHT) * self._dice(row_id, query_grams)
+        return round(score, 4)
+
+
+hsn_matcher = HSNMatcher(hsn_index)
+
 class HSN:
     def __init__(self, data):
         self.id = data.get('id')
@@ -10,17 +194,72 @@ class HSN:
         self.description = data.get('DESCRIPTION')
         self.gst_rate = data.get('GST_RATE')
     
+    @staticmethod
+    def create_tables():
+        """Create the HSN master table if it is missing (it is normally loaded separately)"""
+        query = """
+            CREATE TABLE IF NOT EXISTS hsn (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                HSN_CODE VARCHAR(20) NOT NULL,
+                DESCRIPTION TEXT,
+                GST_RATE DECIMAL(5,2) DEFAULT 0,
+                INDEX idx_hsn_code (HSN_CODE)
+            )
+        """
+        result = db.execute_query(query)
+        if result is None:
+            logger.warning('⚠️ Warning: HSN table creation query failed')
+        else:
+            logger.info('✅ HSN table created/verified')
+
     @staticmethod
     def get_by_item_name(item_name):
         """Get HSN code by matching item name with description"""
         if not item_name:
             return None
         
-        print(f"🔍 Searching HSN for: '{item_name}'")
+        logger.debug("🔍 Searching HSN for: '%s'", item_name)
         
         # Clean the item name
         clean_item_name = item_name.strip().lower()
-        
+
+        indexed = hsn_index.ensure_fresh()
+        # Memoized per index version, so any change to the hsn table starts afresh.
+        # Misses are kept too (as (None,)) - unknown names are the expensive ones.
+        memo_key = f"hsn:name:{hsn_index.version if indexed else 'db'}:{clean_item_name}"
+        memo = local_cache.get(memo_key, 'hsn')
+        if memo is not None:
+            return memo[0]
+
+        if indexed:
+            matched_item, complete = HSN._match_indexed(clean_item_name), True
+        else:
+            matched_item, complete = HSN._match_with_queries(clean_item_name)
+
+        if matched_item:
+            logger.debug('✅ HSN Match found: %s -> %s', matched_item['HSN_CODE'], matched_item['DESCRIPTION'])
+        else:
+            logger.debug("❌ No HSN match found for: '%s'", item_name)
+        if complete:
+            local_cache.set(memo_key, (matched_item,), 'hsn')
+        return matched_item
+
+    @staticmethod
+    def _match_indexed(clean_item_name):
+        matched_item = hsn_index.match(clean_item_name)
+        if not matched_item:
+            # No substring hit ('bolt hex') - take the best ranked description if it is close enough
+            ranked = hsn_matcher.rank(clean_item_name, 1)
+            if ranked and ranked[0][1] >= Config.HSN_MIN_SCORE:
+                matched_item = ranked[0][0]
+        return matched_item
+
+    @staticmethod
+    def _match_with_queries(clean_item_name):
+        """Index unavailable (table unreadable at startup) - ask the database.
+
+        Returns (row or None, complete); a miss is only trusted when every query ran.
+        """
         # Try different matching strategies
         queries = [
             # Exact match
@@ -36,51 +275,98 @@ class HSN:
             ("SELECT * FROM hsn WHERE LOWER(DESCRIPTION) LIKE %s LIMIT 1", [f"{clean_item_name}%"]),
         ]
         
+        complete = True
         for query, params in queries:
             try:
                 result = db.execute_query(query, params)
                 if result:
-                    matched_item = result[0]
-                    print(f"✅ HSN Match found: {matched_item['HSN_CODE']} -> {matched_item['DESCRIPTION']}")
-                    return matched_item
+                    return result[0], True
+                if result is None:
+                    complete = False
             except Exception as e:
-                print(f"❌ Query failed: {query} - Error: {e}")
+                logger.warning('❌ Query failed: %s - Error: %s', query, e)
+                complete = False
                 continue
         
-        print(f"❌ No HSN match found for: '{item_name}'")
-        return None
+        return None, complete
     
+    @staticmethod
+    def resolve_many(item_names):
+        """HSN rows for many item names in one pass, in input order (None where nothing matches)"""
+        cleaned = [(name or '').strip().lower() for name in item_names]
+        unique = sorted({name for name in cleaned if name})
+        if hsn_index.ensure_fresh():
+            resolved = {name: HSN.get_by_item_name(name) for name in unique}
+        else:
+            resolved = HSN._resolve_with_query(unique)
+        logger.debug('🔍 Resolved %s names (%s unique) to HSN codes', len(cleaned), len(unique))
+        return [resolved.get(name) if name else None for name in cleaned]
+
+    @staticmethod
+    def _resolve_with_query(names):
+        """One LIKE query for every name, then the usual priority per name - first row wins"""
+        if not names:
+            return {}
+        where = ' OR '.join(['LOWER(DESCRIPTION) LIKE %s'] * len(names))
+        rows = db.execute_query(f"SELECT * FROM hsn WHERE {where} ORDER BY id", [f"%{name}%" for name in names])
+        if not rows:
+            return {}
+        descriptions = [(row['DESCRIPTION'] or '').lower() for row in rows]
+        resolved = {}
+        for name in names:
+            # Exact beats contains; word-boundary and starts-with hits are contains hits too
+            match = next((row for row, d in zip(rows, descriptions) if d == name), None)
+            if match is None:
+                match = next((row for row, d in zip(rows, descriptions) if name in d), None)
+            resolved[name] = match
+        return resolved
+
     @staticmethod
     def get_all_hsn_codes():
         """Get all HSN codes for dropdown"""
         try:
+            if hsn_index.ensure_fresh():
+                return hsn_index.first_codes(100)
             query = "SELECT HSN_CODE, DESCRIPTION FROM hsn ORDER BY HSN_CODE LIMIT 100"
             result = db.execute_query(query)
-            print(f"📊 Found {len(result) if result else 0} HSN codes")
+            logger.debug('📊 Found %s HSN codes', len(result) if result else 0)
             return result if result else []
         except Exception as e:
-            print(f"❌ Error fetching HSN codes: {e}")
+            logger.warning('❌ Error fetching HSN codes: %s', e)
             return []
     
     @staticmethod
-    def search_hsn_by_name(search_term):
-        """Search HSN codes by item name"""
+    def rank(item_name, limit=5):
+        """Best matching HSN codes for an item name with their scores (0-1), best first"""
+        if not item_name or not hsn_index.ensure_fresh():
+            return []
+        return [
+            {'HSN_CODE': row['HSN_CODE'], 'DESCRIPTION': row['DESCRIPTION'],
+             'GST_RATE': row.get('GST_RATE'), 'score': score}
+            for row, score in hsn_matcher.rank(item_name, limit)
+        ]
+
+    @staticmethod
+    def search_hsn_by_name(search_term, limit=10):
+        """Search HSN codes by item name, most similar first"""
         if not search_term:
             return []
         
         try:
+            if hsn_index.ensure_fresh():
+                return HSN.rank(search_term, limit)
             query = """
                 SELECT HSN_CODE, DESCRIPTION 
                 FROM hsn 
                 WHERE LOWER(DESCRIPTION) LIKE LOWER(%s)
                 ORDER BY HSN_CODE
-                LIMIT 10
+                LIMIT %s
             """
-            params = (f"%{search_term}%",)
+            params = (f"%{search_term}%", limit)
             result = db.execute_query(query, params)
             return result if result else []
         except Exception as e:
-            print(f"❌ Error searching HSN: {e}")
+            logger.warning('❌ Error searching HSN: %s', e)
             return []
 
 class Item:
@@ -131,7 +417,8 @@ class Item:
                 FOREIGN KEY (kit_id) REFERENCES items(id) ON DELETE CASCADE,
                 FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE CASCADE,
                 INDEX idx_kit_id (kit_id),
-                INDEX idx_item_id (item_id)
+                INDEX idx_item_id (item_id),
+                UNIQUE KEY uq_kit_item (kit_id, item_id)
             )
             """
         ]
@@ -139,28 +426,30 @@ class Item:
         for query in queries:
             result = db.execute_query(query)
             if result is None:
-                print(f"⚠️ Warning: Table creation query failed")
+                logger.warning('⚠️ Warning: Table creation query failed')
             else:
-                print(f"✅ Table created/verified")
+                logger.info('✅ Table created/verified')
+
+        for name, columns in Item.LIST_INDEXES:
+            if not db.ensure_index('items', name, columns):
+                logger.warning('⚠️ Warning: Could not add index %s on items', name)
+
+        # Tables from before the unique key may hold a component twice - fold those rows first
+        if not db.has_index('kit_items', 'uq_kit_item'):
+            KitItem.merge_duplicates()
+            if not db.ensure_index('kit_items', 'uq_kit_item', 'kit_id, item_id', unique=True):
+                logger.warning('⚠️ Warning: Could not add unique index uq_kit_item on kit_items')
     
     def save(self):
         """Save or update item in database"""
         try:
             # Auto-fill HSN code if not provided
-            if not self.hsn_code and self.name:
-                print(f"🔍 Attempting to auto-fill HSN for: {self.name}")
-                hsn_data = HSN.get_by_item_name(self.name)
-                if hsn_data:
-                    self.hsn_code = hsn_data['HSN_CODE']
-                    print(f"✅ Auto-filled HSN code: {self.hsn_code}")
-                else:
-                    self.hsn_code = 'DEFAULT_HSN'
-                    print(f"⚠️ Using default HSN code")
+            Item.fill_hsn_codes([self])
             
             # Ensure HSN code exists
-            if not self.hsn_code:
+            if not (self.hsn_code or '').strip():
                 self.hsn_code = 'DEFAULT_HSN'
-                print(f"⚠️ No HSN code provided, using DEFAULT_HSN")
+                logger.warning('⚠️ No HSN code provided, using DEFAULT_HSN')
             
             if self.id:
                 # UPDATE existing item
@@ -176,7 +465,7 @@ class Item:
                     self.stock, self.min_stock, self.hsn_code, self.is_kit, 
                     self.kit_name, self.status, self.id
                 )
-                print(f"📝 Updating item {self.id}: {self.code}")
+                logger.debug('📝 Updating item %s: %s', self.id, self.code)
                 
             else:
                 # INSERT new item
@@ -191,33 +480,45 @@ class Item:
                     self.stock, self.min_stock, self.hsn_code, self.is_kit, 
                     self.kit_name, self.status
                 )
-                print(f"💾 Inserting new item: {self.code}")
+                logger.debug('💾 Inserting new item: %s', self.code)
             
             # Execute query
-            print(f"🔧 Executing query with params: {params}")
+            logger.debug('🔧 Executing query with params: %s', params)
             result = db.execute_query(query, params)
             
             # Handle result
             if result is None:
-                print(f"❌ Query returned None - Save failed!")
+                logger.warning('❌ Query returned None - Save failed!')
                 return None
             
             if not self.id:
                 # For INSERT, result is the new ID
                 self.id = result
-                print(f"✅ Item saved with new ID: {self.id}")
+                logger.debug('✅ Item saved with new ID: %s', self.id)
             else:
                 # For UPDATE, result is row count
-                print(f"✅ Item {self.id} updated successfully")
+                logger.debug('✅ Item %s updated successfully', self.id)
             
             return self.id
             
         except Exception as e:
-            print(f"💥 Error in Item.save(): {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('💥 Error in Item.save(): %s', e)
             return None
     
+    @staticmethod
+    def fill_hsn_codes(items):
+        """Auto-fill every missing (or blank) HSN code through one HSN.resolve_many batch.
+
+        Items without a name are left for save() to default.
+        """
+        pending = [item for item in items if not (item.hsn_code or '').strip() and item.name]
+        if not pending:
+            return
+        logger.debug('🔍 Attempting to auto-fill HSN for %s items', len(pending))
+        for item, hsn_data in zip(pending, HSN.resolve_many([item.name for item in pending])):
+            item.hsn_code = hsn_data['HSN_CODE'] if hsn_data else 'DEFAULT_HSN'
+            logger.debug('✅ HSN for %s: %s', item.name, item.hsn_code)
+
     @staticmethod
     def get_all():
         """Get all items"""
@@ -225,7 +526,7 @@ class Item:
             result = db.execute_query("SELECT * FROM items ORDER BY created_date DESC")
             return result if result else []
         except Exception as e:
-            print(f"❌ Error in get_all(): {e}")
+            logger.warning('❌ Error in get_all(): %s', e)
             return []
     
     @staticmethod
@@ -235,7 +536,7 @@ class Item:
             result = db.execute_query("SELECT * FROM items WHERE id = %s", (item_id,))
             return result[0] if result else None
         except Exception as e:
-            print(f"❌ Error in get_by_id(): {e}")
+            logger.warning('❌ Error in get_by_id(): %s', e)
             return None
     
     @staticmethod
@@ -244,7 +545,7 @@ class Item:
         try:
             return db.execute_query("DELETE FROM items WHERE id = %s", (item_id,))
         except Exception as e:
-            print(f"❌ Error in delete(): {e}")
+            logger.warning('❌ Error in delete(): %s', e)
             return None
     
     @staticmethod
@@ -256,40 +557,161 @@ class Item:
             )
             return result if result else []
         except Exception as e:
-            print(f"❌ Error in get_kit_names(): {e}")
+            logger.warning('❌ Error in get_kit_names(): %s', e)
             return []
     
+    # Items and kit components come from two set-based queries and are joined
+    # up in Python - no per-kit subquery, and components are real arrays
+    ITEMS_SELECT = "SELECT i.* FROM items i "
+    ITEMS_ORDER = "ORDER BY i.created_date DESC, i.id DESC"
+    KIT_COMPONENTS_QUERY = """
+        SELECT ki.kit_id, ki.item_id, it.name AS item_name, it.code AS item_code,
+               ki.quantity, it.unit_price
+        FROM kit_items ki
+        JOIN items it ON ki.item_id = it.id
+    """
+
+    # Keyset pages walk these; id breaks ties so every position in an order is unique
+    LIST_INDEXES = [
+        ('idx_created', 'created_date, id'),
+        ('idx_status_created', 'status, created_date, id'),
+        ('idx_kit_created', 'is_kit, created_date, id'),
+        ('idx_name', 'name, id'),
+    ]
+    # sort name -> (column, descending); code is unique and indexed already
+    LIST_SORTS = {
+        'newest': ('created_date', True),
+        'oldest': ('created_date', False),
+        'code': ('code', False),
+        'name': ('name', False),
+    }
+
+    @staticmethod
+    def load_kit_components(kit_ids=None):
+        """kit_id -> list of its components, for every kit or just kit_ids; None if the query failed"""
+        query, params = Item.KIT_COMPONENTS_QUERY, []
+        if kit_ids is not None:
+            if not kit_ids:
+                return {}
+            query += f"WHERE ki.kit_id IN ({', '.join(['%s'] * len(kit_ids))}) "
+            params = list(kit_ids)
+        rows = db.execute_query(query + "ORDER BY ki.kit_id, ki.id", params)
+        if rows is None:
+            return None
+        components = {}
+        for row in rows:
+            components.setdefault(row['kit_id'], []).append({
+                'item_id': row['item_id'],
+                'item_name': row['item_name'],
+                'item_code': row['item_code'],
+                'quantity': row['quantity'],
+                # A number, as JSON_OBJECT used to render it
+                'unit_price': float(row['unit_price']) if row['unit_price'] is not None else None,
+            })
+        return components
+
+    @staticmethod
+    def with_kit_components(rows, components):
+        """Yield rows with kit_components set: the kit's component list, None for plain items"""
+        for row in rows:
+            row['kit_components'] = components.get(row['id'], []) if row.get('is_kit') else None
+            yield row
+
     @staticmethod
     def get_items_with_kit_info():
         """Get all items with kit component information"""
         try:
-            query = """
-                SELECT 
-                    i.*,
-                    IF(i.is_kit = TRUE, 
-                       (SELECT JSON_ARRAYAGG(
-                            JSON_OBJECT(
-                                'item_id', ki.item_id,
-                                'item_name', it.name,
-                                'item_code', it.code,
-                                'quantity', ki.quantity,
-                                'unit_price', it.unit_price
-                            )
-                        ) 
-                        FROM kit_items ki 
-                        JOIN items it ON ki.item_id = it.id 
-                        WHERE ki.kit_id = i.id),
-                       NULL
-                    ) as kit_components
-                FROM items i
-                ORDER BY i.created_date DESC
-            """
-            result = db.execute_query(query)
-            return result if result else []
+            components = Item.load_kit_components()
+            result = db.execute_query(Item.ITEMS_SELECT + Item.ITEMS_ORDER)
+            if not result or components is None:
+                return []
+            return list(Item.with_kit_components(result, components))
         except Exception as e:
-            print(f"❌ Error in get_items_with_kit_info(): {e}")
+            logger.warning('❌ Error in get_items_with_kit_info(): %s', e)
             return []
 
+    @staticmethod
+    def list_page(sort='newest', limit=100, after=None, status=None, is_kit=None,
+                  low_stock=False, code_prefix=None, name_prefix=None):
+        """One keyset page of items with kit info: (rows, cursor for the next page or None).
+
+        Each page seeks past the last row of the previous one instead of
+        skipping OFFSET rows, so page 1000 costs the same as page 1.
+        """
+        column, descending = Item.LIST_SORTS[sort]
+        where, params = [], []
+        if status:
+            where.append("i.status = %s")
+            params.append(status)
+        if is_kit is not None:
+            where.append("i.is_kit = %s")
+            params.append(is_kit)
+        if low_stock:
+            where.append("i.stock <= i.min_stock")
+        if code_prefix:
+            where.append("i.code LIKE %s ESCAPE '!'")
+            params.append(_like_prefix(code_prefix))
+        if name_prefix:
+            where.append("i.name LIKE %s ESCAPE '!'")
+            params.append(_like_prefix(name_prefix))
+        if after:
+            value, last_id = Item.decode_cursor(after, sort)
+            op = '<' if descending else '>'
+            where.append(f"(i.{column} {op} %s OR (i.{column} = %s AND i.id {op} %s))")
+            params.extend([value, value, last_id])
+
+        direction = 'DESC' if descending else 'ASC'
+        query = Item.ITEMS_SELECT
+        if where:
+            query += "WHERE " + " AND ".join(where)
+        query += f" ORDER BY i.{column} {direction}, i.id {direction} LIMIT %s"
+        # One extra row says whether there is a next page
+        rows = db.execute_query(query, params + [limit + 1])
+        if not rows:
+            return [], None
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = Item.encode_cursor(sort, rows[-1][column], rows[-1]['id'])
+        components = Item.load_kit_components([row['id'] for row in rows if row.get('is_kit')])
+        if components is None:
+            return [], None
+        return list(Item.with_kit_components(rows, components)), next_cursor
+
+    @staticmethod
+    def encode_cursor(sort, value, row_id):
+        """Opaque position after a row: the sort it belongs to, the row's sort value and id"""
+        raw = json.dumps([sort, str(value) if value is not None else None, row_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor, sort):
+        """(value, id) from encode_cursor(); ValueError if it is malformed or from another sort"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            cursor_sort, value, row_id = json.loads(raw)
+        except (ValueError, TypeError) as e:
+            raise ValueError('Invalid cursor') from e
+        if cursor_sort != sort or not isinstance(row_id, int):
+            raise ValueError('Cursor does not match the requested sort')
+        return value, row_id
+
+    @staticmethod
+    def stream_items_with_kit_info():
+        """Stream items with kit component information without loading the whole items table.
+
+        The components are loaded up front, so a failure there surfaces before the response starts.
+        """
+        components = Item.load_kit_components()
+        if components is None:
+            raise RuntimeError('Could not load kit components')
+        return Item.with_kit_components(db.execute_stream(Item.ITEMS_SELECT + Item.ITEMS_ORDER), components)
+
+def _like_prefix(text):
+    # '!' escapes LIKE wildcards the same way on MySQL and SQLite
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+
+
 class KitItem:
     def __init__(self, data):
         self.id = data.get('id')
@@ -301,23 +723,151 @@ class KitItem:
         try:
             query = "INSERT INTO kit_items (kit_id, item_id, quantity) VALUES (%s, %s, %s)"
             params = (self.kit_id, self.item_id, self.quantity)
-            print(f"💾 Saving kit item: kit_id={self.kit_id}, item_id={self.item_id}, qty={self.quantity}")
+            logger.debug('💾 Saving kit item: kit_id=%s, item_id=%s, qty=%s', self.kit_id, self.item_id, self.quantity)
             
             result = db.execute_query(query, params)
             
             if result:
-                print(f"✅ Kit item saved with ID: {result}")
+                logger.debug('✅ Kit item saved with ID: %s', result)
                 return result
             else:
-                print(f"❌ Failed to save kit item")
+                logger.warning('❌ Failed to save kit item')
                 return None
                 
         except Exception as e:
-            print(f"💥 Error in KitItem.save(): {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('💥 Error in KitItem.save(): %s', e)
             return None
     
+    @staticmethod
+    def component_quantities(components):
+        """item_id -> quantity from submitted components, in order.
+
+        Components without an item_id are skipped; one listed twice is
+        merged, since a kit holds each item in a single row.
+        """
+        quantities = {}
+        for component in components:
+            if not component.get('item_id'):
+                continue
+            try:
+                item_id, quantity = int(component['item_id']), int(component.get('quantity', 1))
+            except (ValueError, TypeError) as e:
+                logger.warning('⚠️ Skipping invalid kit component %s: %s', component, e)
+                continue
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+        return quantities
+
+    @staticmethod
+    def save_many(kit_id, components):
+        """Save all components of a kit in one multi-row INSERT.
+
+        Components without an item_id are skipped. Returns the number of
+        rows written, or None if the insert failed.
+        """
+        try:
+            rows = [(kit_id, item_id, quantity)
+                    for item_id, quantity in KitItem.component_quantities(components).items()]
+            logger.debug('💾 Saving %s kit items for kit_id=%s', len(rows), kit_id)
+            query = "INSERT INTO kit_items (kit_id, item_id, quantity) VALUES (%s, %s, %s)"
+            return db.execute_many(query, rows)
+        except Exception as e:
+            logger.error('💥 Error in KitItem.save_many(): %s', e)
+            return None
+
+    @staticmethod
+    def reconcile(kit_id, components):
+        """Make the stored components of a kit match components, writing only what differs.
+
+        Runs on the request's transaction: one locking read, then at most one
+        DELETE, one UPDATE and one multi-row INSERT. Returns the applied diff;
+        database errors propagate so the caller can fail (and roll back) the request.
+        """
+        wanted = KitItem.component_quantities(components)
+        connection = db.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT id, item_id, quantity FROM kit_items WHERE kit_id = %s ORDER BY id FOR UPDATE", (kit_id,)
+            )
+            stored, duplicate_ids = {}, []
+            for row in cursor.fetchall():
+                if row['item_id'] in stored:
+                    duplicate_ids.append(row['id'])
+                else:
+                    stored[row['item_id']] = row
+
+            inserted = [{'item_id': item_id, 'quantity': quantity}
+                        for item_id, quantity in wanted.items() if item_id not in stored]
+            updated = [{'item_id': item_id, 'quantity': quantity, 'previous_quantity': stored[item_id]['quantity']}
+                       for item_id, quantity in wanted.items()
+                       if item_id in stored and stored[item_id]['quantity'] != quantity]
+            deleted = [{'item_id': item_id, 'quantity': row['quantity']}
+                       for item_id, row in stored.items() if item_id not in wanted]
+
+            delete_ids = [stored[d['item_id']]['id'] for d in deleted] + duplicate_ids
+            if delete_ids:
+                cursor.execute(
+                    f"DELETE FROM kit_items WHERE id IN ({', '.join(['%s'] * len(delete_ids))})", delete_ids
+                )
+            if updated:
+                # One statement for every changed quantity
+                cases = ' '.join(['WHEN %s THEN %s'] * len(updated))
+                params = []
+                for change in updated:
+                    params.extend([stored[change['item_id']]['id'], change['quantity']])
+                ids = [stored[change['item_id']]['id'] for change in updated]
+                cursor.execute(
+                    f"UPDATE kit_items SET quantity = CASE id {cases} END "
+                    f"WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                    params + ids
+                )
+            if inserted:
+                cursor.executemany(
+                    "INSERT INTO kit_items (kit_id, item_id, quantity) VALUES (%s, %s, %s)",
+                    [(kit_id, change['item_id'], change['quantity']) for change in inserted]
+                )
+        finally:
+            cursor.close()
+            connection.close()
+
+        logger.debug('🔄 Kit %s reconciled: +%s ~%s -%s', kit_id, len(inserted), len(updated), len(deleted))
+        return {
+            'inserted': inserted,
+            'updated': updated,
+            'deleted': deleted,
+            'unchanged': len(stored) - len(updated) - len(deleted),
+        }
+
+    @staticmethod
+    def merge_duplicates():
+        """Fold rows that list the same item twice in one kit into one row with the summed quantity"""
+        try:
+            rows = db.execute_query("""
+                SELECT ki.id, ki.kit_id, ki.item_id, ki.quantity
+                FROM kit_items ki
+                JOIN (SELECT kit_id, item_id FROM kit_items GROUP BY kit_id, item_id HAVING COUNT(*) > 1) d
+                  ON ki.kit_id = d.kit_id AND ki.item_id = d.item_id
+                ORDER BY ki.id
+            """)
+            if not rows:
+                return 0
+            keep, totals, extra_ids = {}, {}, []
+            for row in rows:
+                pair = (row['kit_id'], row['item_id'])
+                if pair in keep:
+                    extra_ids.append(row['id'])
+                else:
+                    keep[pair] = row['id']
+                totals[pair] = totals.get(pair, 0) + row['quantity']
+            db.execute_many("UPDATE kit_items SET quantity = %s WHERE id = %s",
+                            [(totals[pair], row_id) for pair, row_id in keep.items()])
+            db.execute_query(f"DELETE FROM kit_items WHERE id IN ({', '.join(['%s'] * len(extra_ids))})", extra_ids)
+            logger.warning('⚠️ Merged %s duplicate kit component rows', len(extra_ids))
+            return len(extra_ids)
+        except Exception as e:
+            logger.error('💥 Error in KitItem.merge_duplicates(): %s', e)
+            return None
+
     @staticmethod
     def get_kit_items(kit_id):
         """Get all items in a kit"""
@@ -331,23 +881,65 @@ class KitItem:
             result = db.execute_query(query, (kit_id,))
             return result if result else []
         except Exception as e:
-            print(f"❌ Error in get_kit_items(): {e}")
+            logger.warning('❌ Error in get_kit_items(): %s', e)
             return []
     
+    @staticmethod
+    def get_kit_items_many(kit_ids):
+        """kit_id -> its kit items (as get_kit_items returns them) for many kits in one query"""
+        if not kit_ids:
+            return {}
+        try:
+            query = f"""
+                SELECT ki.*, i.name as item_name, i.code as item_code, i.unit_price
+                FROM kit_items ki
+                JOIN items i ON ki.item_id = i.id
+                WHERE ki.kit_id IN ({', '.join(['%s'] * len(kit_ids))})
+                ORDER BY ki.kit_id, ki.id
+            """
+            result = db.execute_query(query, list(kit_ids))
+            kit_items = {kit_id: [] for kit_id in kit_ids}
+            for row in result or []:
+                kit_items[row['kit_id']].append(row)
+            return kit_items
+        except Exception as e:
+            logger.warning('❌ Error in get_kit_items_many(): %s', e)
+            return {}
+
+    @staticmethod
+    def get_kit_ids(kit_ids=None):
+        """Ids of every kit, or of those among kit_ids that are kits - None if the query failed"""
+        try:
+            query, params = "SELECT id FROM items WHERE is_kit = TRUE", []
+            if kit_ids is not None:
+                if not kit_ids:
+                    return []
+                query += f" AND id IN ({', '.join(['%s'] * len(kit_ids))})"
+                params = list(kit_ids)
+            result = db.execute_query(query + " ORDER BY id", params)
+            return [row['id'] for row in result] if result is not None else None
+        except Exception as e:
+            logger.warning('❌ Error in get_kit_ids(): %s', e)
+            return None
+
     @staticmethod
     def delete_kit_items(kit_id):
         """Delete all kit items for a kit"""
         try:
-            print(f"🗑️ Deleting kit items for kit_id: {kit_id}")
+            logger.debug('🗑️ Deleting kit items for kit_id: %s', kit_id)
             return db.execute_query("DELETE FROM kit_items WHERE kit_id = %s", (kit_id,))
         except Exception as e:
-            print(f"❌ Error in delete_kit_items(): {e}")
+            logger.warning('❌ Error in delete_kit_items(): %s', e)
             return None
     
     @staticmethod
     def get_kit_total_value(kit_id):
-        """Calculate total value of a kit"""
+        """Calculate total value of a kit, through every level of nested kits"""
         try:
+            if bom.ensure_fresh([kit_id]):
+                rollup = bom.rollup(kit_id, components=False)
+                return rollup.get('total_cost', 0) if rollup else 0
+            # Kit graph unavailable - one level from the database
             query = """
                 SELECT SUM(ki.quantity * i.unit_price) as total_value
                 FROM kit_items ki
@@ -357,5 +949,5 @@ class KitItem:
             result = db.execute_query(query, (kit_id,))
             return result[0]['total_value'] if result and result[0]['total_value'] else 0
         except Exception as e:
-            print(f"❌ Error in get_kit_total_value(): {e}")
+            logger.warning('❌ Error in get_kit_total_value(): %s', e)
             return 0
\ No newline at end of file
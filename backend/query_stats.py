@@ -0,0 +1,297 @@
+# backend/query_stats.py - per-statement timing, counters and slow-query log
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('backend.slow_query')
+
+if Config.SLOW_QUERY_LOG_FILE:
+    _handler = logging.FileHandler(Config.SLOW_QUERY_LOG_FILE)
+    _handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+    slow_logger.addHandler(_handler)
+
+# Histogram upper bounds in milliseconds; the last bucket catches everything slower
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(query):
+    """Normalize a statement to its shape: literals and placeholders become ?, lists collapse"""
+    shape = _STRING.sub('?', query)
+    shape = shape.replace('%s', '?')
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(...)', shape)
+    shape = _VALUES_LIST.sub(r'\1', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Thread-safe latency histograms, row counts and error counts per statement fingerprint"""
+
+    # Unbounded fingerprints would leak memory on ad-hoc SQL - the rest share one bucket
+    MAX_FINGERPRINTS = 500
+    OVERFLOW = '<other>'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started_at = time.time()
+
+    def record(self, query, elapsed, rows=None, error=False, param_count=0):
+        shape = fingerprint(query)
+        elapsed_ms = elapsed * 1000.0
+        with self._lock:
+            entry = self._stats.get(shape)
+            if entry is None:
+                if len(self._stats) >= self.MAX_FINGERPRINTS:
+                    shape = self.OVERFLOW
+                    entry = self._stats.get(shape)
+                if entry is None:
+                    entry = self._stats[shape] = {
+                        'count': 0,
+                        'errors': 0,
+                        'rows': 0,
+                        'total_ms': 0.0,
+                        'max_ms': 0.0,
+                        'buckets': [0] * (len(BUCKETS_MS) + 1),
+                    }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            if error:
+                entry['errors'] += 1
+            if rows is not None and rows > 0:
+                entry['rows'] += rows
+            entry['buckets'][_bucket_index(elapsed_ms)] += 1
+
+        for tracker in _trackers.get():
+            tracker.add(shape)
+
+        if elapsed_ms >= Config.SLOW_QUERY_MS:
+            # Shape only - parameter values can carry customer data
+            slow_logger.warning(
+                f"🐢 Slow query {elapsed_ms:.1f}ms rows={rows} "
+                f"[{param_count} params redacted]: {shape}"
+            )
+
+    def snapshot(self):
+        """Aggregates per fingerprint, most total time first"""
+        with self._lock:
+            entries = [(shape, dict(entry, buckets=list(entry['buckets'])))
+                       for shape, entry in self._stats.items()]
+        statements = []
+        for shape, entry in entries:
+            statements.append({
+                'fingerprint': shape,
+                'count': entry['count'],
+                'errors': entry['errors'],
+                'rows': entry['rows'],
+                'total_ms': round(entry['total_ms'], 3),
+                'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+                'max_ms': round(entry['max_ms'], 3),
+                'histogram': {
+                    (f'le_{bound}ms' if i < len(BUCKETS_MS) else 'inf'): n
+                    for i, (bound, n) in enumerate(zip(BUCKETS_MS + (None,), entry['buckets']))
+                },
+            })
+        statements.sort(key=lambda s: s['total_ms'], reverse=True)
+        return {
+            'since': self.started_at,
+            'slow_query_ms': Config.SLOW_QUERY_MS,
+            'total_queries': sum(s['count'] for s in statements),
+            'total_errors': sum(s['errors'] for s in statements),
+            'statements': statements,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self.started_at = time.time()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by query_budget() when a block runs more statements than allowed"""
+
+
+class QueryTracker:
+    """Counts the statements run while it is active and spots repeated shapes (N+1)"""
+
+    def __init__(self):
+        self.shapes = Counter()
+
+    def add(self, shape):
+        self.shapes[shape] += 1
+
+    @property
+    def count(self):
+        return sum(self.shapes.values())
+
+    def repeated(self, threshold=None):
+        """Shapes run at least threshold times - the usual sign of a query in a loop"""
+        threshold = threshold or Config.QUERY_REPEAT_THRESHOLD
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+# Every active tracker sees every statement, so a test budget and the
+# request tracker can both be counting at once
+_trackers = ContextVar('query_trackers', default=())
+
+
+@contextmanager
+def track_queries():
+    """Count the statements run inside the block"""
+    tracker = QueryTracker()
+    token = _trackers.set(_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _trackers.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None):
+    """Fail the block if it runs more than max_queries statements.
+
+    With max_repeats set, also fail if any one statement shape runs more
+    than max_repeats times. Meant for tests:
+
+        with query_budget(3):
+            client.get('/api/invoices/1')
+    """
+    with track_queries() as tracker:
+        yield tracker
+    if tracker.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{tracker.count} queries run, budget is {max_queries}: {dict(tracker.shapes)}"
+        )
+    if max_repeats is not None:
+        over = {shape: n for shape, n in tracker.shapes.items() if n > max_repeats}
+        if over:
+            raise QueryBudgetExceeded(f"Statements repeated more than {max_repeats} times: {over}")
+
+
+def init_app(app):
+    """In QUERY_DEBUG mode (or when testing) count statements per request.
+
+    Adds X-Query-Count and X-Query-Repeats response headers and logs any
+    statement shape repeated QUERY_REPEAT_THRESHOLD or more times.
+
+    Streamed lists are counted too: Database.execute_stream runs its
+    statement inside the view, before the headers are built - only the
+    fetches of its rows happen while the body is sent, and those are not
+    statements.
+    """
+    from flask import g, request
+
+    def enabled():
+        return Config.QUERY_DEBUG or app.testing
+
+    @app.before_request
+    def start_query_tracking():
+        if not enabled():
+            return
+        tracker = QueryTracker()
+        g.query_tracker = tracker
+        g.query_tracker_token = _trackers.set(_trackers.get() + (tracker,))
+
+    @app.after_request
+    def report_query_count(response):
+        tracker = g.get('query_tracker')
+        if tracker is None:
+            return response
+        repeated = tracker.repeated()
+        response.headers['X-Query-Count'] = str(tracker.count)
+        response.headers['X-Query-Repeats'] = str(len(repeated))
+        for shape, n in repeated.items():
+            logger.warning(f"🔁 Possible N+1 on {request.method} {request.path}: {n}x {shape}")
+        if Config.QUERY_BUDGET and tracker.count > Config.QUERY_BUDGET:
+            response.headers['X-Query-Budget-Exceeded'] = str(Config.QUERY_BUDGET)
+            logger.warning(
+                f"⚠️ {request.method} {request.path} ran {tracker.count} queries "
+                f"(budget {Config.QUERY_BUDGET})"
+            )
+        return response
+
+    @app.teardown_request
+    def stop_query_tracking(exc):
+        token = g.pop('query_tracker_token', None)
+        if token is not None:
+            _trackers.reset(token)
+
+
+def _bucket_index(elapsed_ms):
+    for i, bound in enumerate(BUCKETS_MS):
+        if elapsed_ms <= bound:
+            return i
+    return len(BUCKETS_MS)
+
+
+def _param_count(args):
+    if args is None:
+        return 0
+    if isinstance(args, (list, tuple, dict)):
+        return len(args)
+    return 1
+
+
+class InstrumentedCursor:
+    """Wraps a DB-API cursor and records every execute()/executemany() in query_stats"""
+
+    def __init__(self, raw, count_rows=True):
+        self._raw = raw
+        # Unbuffered cursors don't know their row count until fully read
+        self._count_rows = count_rows
+
+    def _rows(self):
+        return self._raw.rowcount if self._count_rows else None
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            result = self._raw.execute(query, args)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - start, error=True,
+                               param_count=_param_count(args))
+            raise
+        query_stats.record(query, time.perf_counter() - start, rows=self._rows(),
+                           param_count=_param_count(args))
+        return result
+
+    def executemany(self, query, args):
+        args = list(args)
+        start = time.perf_counter()
+        try:
+            result = self._raw.executemany(query, args)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - start, error=True,
+                               param_count=sum(_param_count(a) for a in args))
+            raise
+        query_stats.record(query, time.perf_counter() - start, rows=self._rows(),
+                           param_count=sum(_param_count(a) for a in args))
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._raw.close()
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+query_stats = QueryStats()
@@ -1,12 +1,14 @@
 from backend.database import Database
+import logging
 
+logger = logging.getLogger(__name__)
 db = Database()
 
 class QuotationInvoiceModels:
     @staticmethod
     def create_tables():
         """Create quotation and invoice related tables"""
-        print("📊 Creating quotation and invoice tables...")
+        logger.info('📊 Creating quotation and invoice tables...')
         
         queries = [
             # Quotations table
@@ -91,9 +93,9 @@ class QuotationInvoiceModels:
             try:
                 result = db.execute_query(query)
                 if result is None:
-                    print(f"⚠️ Warning: Table creation query {i+1} failed")
+                    logger.warning('⚠️ Warning: Table creation query %s failed', i+1)
                 else:
                     table_name = query.split('CREATE TABLE IF NOT EXISTS ')[1].split(' (')[0]
-                    print(f"✅ Table {table_name} created/verified")
+                    logger.info('✅ Table %s created/verified', table_name)
             except Exception as e:
-                print(f"❌ Error creating table {i+1}: {e}")
\ No newline at end of file
+                logger.warning('❌ Error creating table %s: %s', i+1, e)
\ No newline at end of file
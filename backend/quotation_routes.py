@@ -1,14 +1,17 @@
 from flask import Blueprint, request, jsonify
 from backend.database import Database
+from backend.streaming import stream_rows
+from backend.cache_manager import CacheManager
+from backend.http_cache import conditional
 from datetime import datetime
 import logging
-import traceback
 
 quotation_bp = Blueprint('quotation', __name__)
 logger = logging.getLogger(__name__)
 db = Database()
 
 @quotation_bp.route('/quotations', methods=['GET', 'POST', 'OPTIONS'])
+@conditional('quotations', 'customers')
 def handle_quotations():
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'}), 200
@@ -21,12 +24,7 @@ def handle_quotations():
                 LEFT JOIN customers c ON q.customer_id = c.id 
                 ORDER BY q.created_date DESC
             """
-            quotations = db.execute_query(query)
-            return jsonify({
-                'quotations': quotations or [],
-                'count': len(quotations) if quotations else 0,
-                'success': True
-            }), 200
+            return stream_rows(db.execute_stream(query), 'quotations'), 200
         except Exception as e:
             logger.error(f"Error fetching quotations: {e}")
             return jsonify({'message': 'Error fetching quotations', 'success': False}), 500
@@ -34,11 +32,8 @@ def handle_quotations():
     elif request.method == 'POST':
         try:
             data = request.get_json()
-            print("\n" + "=" * 80)
-            print("📄 POST /quotations - CREATE NEW QUOTATION")
-            print("=" * 80)
-            print(f"Received data: {data}")
-            print("=" * 80)
+            logger.debug('📄 POST /quotations - CREATE NEW QUOTATION')
+            logger.debug('Received data: %s', data)
 
             # Validate required fields
             required_fields = ['quotation_number', 'customer_id', 'quotation_date', 'items']
@@ -46,12 +41,12 @@ def handle_quotations():
             
             if missing_fields:
                 error_msg = f'Missing required fields: {", ".join(missing_fields)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
             # Start transaction
             connection = db.get_connection()
-            cursor = connection.cursor(dictionary=True)
+            cursor = connection.cursor()
             
             try:
                 # Insert quotation
@@ -78,14 +73,15 @@ def handle_quotations():
                 
                 # Insert quotation items
                 if data['items']:
-                    for item in data['items']:
-                        item_query = """
-                            INSERT INTO quotation_items 
-                            (quotation_id, item_id, item_name, hsn_code, quantity, 
-                             unit_price, discount, tax_rate, total_price)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        item_params = (
+                    # All lines in one multi-row INSERT
+                    item_query = """
+                        INSERT INTO quotation_items 
+                        (quotation_id, item_id, item_name, hsn_code, quantity, 
+                         unit_price, discount, tax_rate, total_price)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """
+                    item_rows = [
+                        (
                             quotation_id,
                             item.get('item_id'),
                             item.get('item_name'),
@@ -96,10 +92,13 @@ def handle_quotations():
                             item.get('tax_rate', 0),
                             item.get('total_price', 0)
                         )
-                        cursor.execute(item_query, item_params)
+                        for item in data['items']
+                    ]
+                    cursor.executemany(item_query, item_rows)
                 
+                CacheManager.touch('quotations')
                 connection.commit()
-                print(f"✅ Quotation created successfully with ID: {quotation_id}")
+                logger.debug('✅ Quotation created successfully with ID: %s', quotation_id)
                 
                 return jsonify({
                     'message': 'Quotation created successfully',
@@ -116,11 +115,11 @@ def handle_quotations():
                 
         except Exception as e:
             logger.error(f"Error creating quotation: {e}")
-            print(f"💥 EXCEPTION in POST /quotations:")
-            traceback.print_exc()
+            logger.exception('💥 EXCEPTION in POST /quotations:')
             return jsonify({'message': f'Server error: {str(e)}', 'success': False}), 500
 
 @quotation_bp.route('/quotations/<int:quotation_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('quotations', 'customers', 'items')
 def handle_quotation(quotation_id):
     if request.method == 'GET':
         try:
@@ -163,6 +162,7 @@ def handle_quotation(quotation_id):
             cursor.execute("DELETE FROM quotation_items WHERE quotation_id = %s", (quotation_id,))
             cursor.execute("DELETE FROM quotations WHERE id = %s", (quotation_id,))
             
+            CacheManager.touch('quotations')
             connection.commit()
             cursor.close()
             connection.close()
@@ -175,14 +175,28 @@ def handle_quotation(quotation_id):
 @quotation_bp.route('/quotations/<int:quotation_id>/finalize', methods=['POST'])
 def finalize_quotation(quotation_id):
     try:
-        # Update quotation status to Finalized
-        query = "UPDATE quotations SET status = 'Finalized' WHERE id = %s"
-        result = db.execute_query(query, (quotation_id,))
+        connection = db.get_connection()
+        cursor = connection.cursor()
         
-        if result:
+        try:
+            # An UPDATE returns no id, so check the quotation exists first
+            cursor.execute("SELECT status FROM quotations WHERE id = %s", (quotation_id,))
+            if not cursor.fetchone():
+                return jsonify({'message': 'Quotation not found', 'success': False}), 404
+            
+            # Update quotation status to Finalized
+            cursor.execute("UPDATE quotations SET status = 'Finalized' WHERE id = %s", (quotation_id,))
+            
+            CacheManager.touch('quotations')
+            connection.commit()
             return jsonify({'message': 'Quotation finalized successfully', 'success': True}), 200
-        else:
-            return jsonify({'message': 'Error finalizing quotation', 'success': False}), 500
+            
+        except Exception as e:
+            connection.rollback()
+            raise e
+        finally:
+            cursor.close()
+            connection.close()
             
     except Exception as e:
         logger.error(f"Error finalizing quotation: {e}")
@@ -191,4 +205,4 @@ def finalize_quotation(quotation_id):
 def register_quotation_routes(app):
     """Registers quotation routes with the Flask app."""
     app.register_blueprint(quotation_bp, url_prefix='/api')
-    print("✅ Quotation routes registered successfully")
\ No newline at end of file
+    logger.info('✅ Quotation routes registered successfully')
\ No newline at end of file
@@ -1,12 +1,17 @@
 # File: backend/routes.py
 
-from flask import Blueprint, request, jsonify
-from backend.models import Item, KitItem, HSN
+from flask import Blueprint, Response, current_app, request, jsonify
+from backend.models import Item, KitItem, HSN, hsn_matcher
+from backend.hsn_index import hsn_index
+from backend.bom import bom
 from backend.cache_manager import cache, CacheManager
 from backend.database import Database
+from backend.config import Config
+from backend.streaming import stream_rows, render_rows, body_format
+from backend.http_cache import conditional
+from backend.query_stats import query_stats
 from datetime import datetime
 import logging
-import traceback
 
 api = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
@@ -15,36 +20,115 @@ db = Database()
 # ============================
 # 📦 ITEMS ENDPOINTS
 # ============================
+ITEMS_PAGE_ARGS = ('limit', 'after', 'sort', 'status', 'is_kit', 'low_stock', 'code_prefix', 'name_prefix')
+
+
+def items_page_params(args):
+    """Item.list_page() arguments from the query string; ValueError on a bad value"""
+    params = {'limit': args.get('limit', Config.ITEMS_PAGE_SIZE, type=int)}
+    if not 1 <= params['limit'] <= Config.ITEMS_PAGE_MAX:
+        raise ValueError(f'limit must be between 1 and {Config.ITEMS_PAGE_MAX}')
+    params['sort'] = args.get('sort', 'newest')
+    if params['sort'] not in Item.LIST_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(Item.LIST_SORTS)}")
+    if args.get('status'):
+        if args['status'] not in ('Active', 'Inactive'):
+            raise ValueError('status must be Active or Inactive')
+        params['status'] = args['status']
+    for flag in ('is_kit', 'low_stock'):
+        if args.get(flag):
+            if args[flag].lower() not in ('true', 'false', '1', '0'):
+                raise ValueError(f'{flag} must be true or false')
+            params[flag] = args[flag].lower() in ('true', '1')
+    for prefix in ('code_prefix', 'name_prefix', 'after'):
+        if args.get(prefix):
+            params[prefix] = args[prefix]
+    if 'after' in params:
+        Item.decode_cursor(params['after'], params['sort'])
+    return params
+
+
+def render_items_page(params, fmt):
+    """(body, mimetype, next cursor) for one page of items"""
+    rows, next_cursor = Item.list_page(**params)
+    if fmt == 'ndjson':
+        body, mimetype = render_rows(rows, None, fmt)
+    else:
+        body = current_app.json.dumps(
+            {'items': rows, 'count': len(rows), 'next_cursor': next_cursor, 'success': True},
+            separators=(',', ':')
+        )
+        mimetype = 'application/json'
+    return body, mimetype, next_cursor
+
+
+def get_items_page():
+    try:
+        params = items_page_params(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'success': False}), 400
+    fmt = body_format()
+    key = CacheManager.get_items_page_cache_key(fmt, params)
+    body, mimetype, next_cursor = CacheManager.cached(key, lambda: render_items_page(params, fmt))
+    response = Response(body, mimetype=mimetype)
+    if next_cursor:
+        # NDJSON has no envelope to carry it
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
 @api.route('/items', methods=['GET', 'POST', 'OPTIONS'])
+@conditional('items')
 def handle_items():
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'}), 200
         
     if request.method == 'GET':
         try:
-            items = Item.get_items_with_kit_info()
-            print(f"✅ GET /items - Returning {len(items)} items")
-            return jsonify({
-                'items': items,
-                'count': len(items),
-                'success': True
-            }), 200
+            if any(name in request.args for name in ITEMS_PAGE_ARGS):
+                return get_items_page()
+            fmt = body_format()
+            key = CacheManager.get_items_cache_key(fmt)
+            cached, stale = CacheManager.lookup(key)
+            if stale:
+                CacheManager.refresh_async(
+                    key, lambda: render_rows(Item.stream_items_with_kit_info(), 'items', fmt)
+                )
+            flight = None
+            if cached is None:
+                # Concurrent misses wait for one query instead of all running it
+                cached, flight = CacheManager.acquire(key)
+            if cached is not None:
+                body, mimetype = cached
+                return Response(body, mimetype=mimetype), 200
+            # Stream on a miss and keep the finished body for the next request.
+            # A stream that fails raises - before the response, or by aborting the body -
+            # so store() only ever sees a complete catalogue.
+            def store(body):
+                CacheManager.set(key, (body, response.mimetype))
+                CacheManager.release(flight)
+
+            try:
+                rows = Item.stream_items_with_kit_info()
+            except Exception:
+                CacheManager.release(flight)
+                raise
+            response = stream_rows(rows, 'items', on_complete=store)
+            # A client that disconnects mid-stream must not leave the waiters hanging
+            response.call_on_close(lambda: CacheManager.release(flight))
+            return response, 200
         except Exception as e:
-            logger.error(f"Error fetching items: {e}")
-            traceback.print_exc()
+            logger.exception(f"Error fetching items: {e}")
             return jsonify({'message': 'Error fetching items', 'success': False}), 500
 
     elif request.method == 'POST':
         try:
             data = request.get_json()
-            print("\n" + "=" * 80)
-            print("📦 POST /items - CREATE NEW ITEM")
-            print("=" * 80)
-            print(f"Received data: {data}")
-            print("=" * 80)
+            logger.debug('📦 POST /items - CREATE NEW ITEM')
+            logger.debug('Received data: %s', data)
 
             if not data:
-                print("❌ No data provided")
+                logger.warning('❌ No data provided')
                 return jsonify({'message': 'No data provided', 'success': False}), 400
 
             # Validate required fields
@@ -59,7 +143,7 @@ def handle_items():
 
             if missing_fields:
                 error_msg = f'Missing required fields: {", ".join(missing_fields)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
             # Convert data types
@@ -68,81 +152,38 @@ def handle_items():
                 data['stock'] = int(data['stock'])
                 data['min_stock'] = int(data['min_stock'])
                 data['is_kit'] = bool(data.get('is_kit', False))
-                print(f"✅ Data types converted successfully")
+                logger.debug('✅ Data types converted successfully')
             except (ValueError, TypeError) as e:
                 error_msg = f'Invalid data type: {str(e)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
-            # Handle HSN code
-            if not data.get('hsn_code') or data.get('hsn_code', '').strip() == '':
-                if data.get('name'):
-                    print(f"🔍 Attempting HSN auto-fill for: {data['name']}")
-                    hsn_data = HSN.get_by_item_name(data['name'])
-                    if hsn_data:
-                        data['hsn_code'] = hsn_data['HSN_CODE']
-                        print(f"✅ Auto-filled HSN: {data['hsn_code']}")
-                    else:
-                        data['hsn_code'] = 'DEFAULT_HSN'
-                        print(f"⚠️ Using default HSN code")
-                else:
-                    data['hsn_code'] = 'DEFAULT_HSN'
-                    print(f"⚠️ No name provided, using default HSN")
-
             # Create item first
-            print(f"💾 Creating item: {data['code']}")
+            logger.debug('💾 Creating item: %s', data['code'])
             item = Item(data)
             item_id = item.save()
 
             if not item_id:
-                print("❌ Failed to create item - save() returned None")
+                logger.warning('❌ Failed to create item - save() returned None')
                 return jsonify({'message': 'Error creating item in database', 'success': False}), 500
 
-            print(f"✅ Item created successfully with ID: {item_id}")
+            logger.debug('✅ Item created successfully with ID: %s', item_id)
 
             # Handle kit items if it's a kit
             # In your POST /items route - enhance the kit section:
             # In your POST /items route - enhance the kit section:
             if data.get('is_kit') and data.get('kit_items'):
                 kit_items = data['kit_items']
-                print(f"📦 KIT DETECTED - Processing {len(kit_items)} components for kit_id: {item_id}")
+                logger.debug('📦 KIT DETECTED - Processing %s components for kit_id: %s', len(kit_items), item_id)
                 
-                success_count = 0
-                for idx, kit_item_data in enumerate(kit_items):
-                    try:
-                        print(f"🔧 Kit Component {idx+1}: {kit_item_data}")
-                        
-                        if not kit_item_data.get('item_id'):
-                            print(f"⚠️ Skipping - No item_id in component {idx+1}")
-                            continue
-                        
-                        kit_item = KitItem({
-                            'kit_id': item_id,
-                            'item_id': int(kit_item_data['item_id']),
-                            'quantity': int(kit_item_data.get('quantity', 1))
-                        })
-                        
-                        print(f"💾 Saving to kit_items: kit_id={kit_item.kit_id}, item_id={kit_item.item_id}, quantity={kit_item.quantity}")
-                        result = kit_item.save()
-                        
-                        if result:
-                            success_count += 1
-                            print(f"✅ Component {idx+1} saved to kit_items table with ID: {result}")
-                        else:
-                            print(f"❌ FAILED to save component {idx+1} to kit_items")
-                            
-                    except Exception as e:
-                        print(f"💥 ERROR saving component {idx+1}: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        continue
+                # All components in one multi-row INSERT
+                success_count = KitItem.save_many(item_id, kit_items) or 0
+                CacheManager.touch('kit_items')
                 
-                print(f"🎯 KIT SAVE SUMMARY: {success_count}/{len(kit_items)} components saved to kit_items table")
+                logger.debug('🎯 KIT SAVE SUMMARY: %s/%s components saved to kit_items table', success_count, len(kit_items))
             CacheManager.clear_items_cache()
             
-            print("=" * 80)
-            print(f"🎉 SUCCESS - Item {data['code']} created with ID: {item_id}")
-            print("=" * 80 + "\n")
+            logger.debug('🎉 SUCCESS - Item %s created with ID: %s', data['code'], item_id)
             
             return jsonify({
                 'message': 'Item created successfully',
@@ -152,15 +193,14 @@ def handle_items():
 
         except Exception as e:
             logger.error(f"Error creating item: {e}")
-            print(f"💥 EXCEPTION in POST /items:")
-            traceback.print_exc()
+            logger.exception('💥 EXCEPTION in POST /items:')
             return jsonify({'message': f'Server error: {str(e)}', 'success': False}), 500
 @api.route('/test-save', methods=['POST'])
 def test_save():
     """Simple test endpoint"""
     try:
         data = request.get_json()
-        print("🎯 TEST ENDPOINT - Received data:", data)
+        logger.debug('🎯 TEST ENDPOINT - Received data: %s', data)
         
         # Simple save without validation
         query = """
@@ -180,7 +220,10 @@ def test_save():
         )
         
         result = db.execute_query(query, params)
-        print("✅ TEST SAVE RESULT:", result)
+        logger.debug('✅ TEST SAVE RESULT: %s', result)
+        if result is None:
+            return jsonify({'message': 'Test save failed', 'success': False}), 500
+        CacheManager.clear_items_cache()
         
         return jsonify({
             'message': 'Test save successful',
@@ -189,31 +232,36 @@ def test_save():
         }), 201
         
     except Exception as e:
-        print("❌ TEST SAVE ERROR:", e)
+        logger.warning('❌ TEST SAVE ERROR: %s', e)
         return jsonify({'message': str(e), 'success': False}), 500
 # ============================
 # 🧩 SINGLE ITEM ENDPOINT
 # ============================
+def load_item(item_id):
+    """Item row with its kit components attached, or None"""
+    item = Item.get_by_id(item_id)
+    if item and item.get('is_kit'):
+        kit_items = KitItem.get_kit_items(item_id)
+        item['kit_components'] = kit_items
+        logger.debug('✅ Item %s retrieved with %s components', item_id, len(kit_items))
+    elif item:
+        logger.debug('✅ Item %s retrieved', item_id)
+    return item
+
 @api.route('/items/<int:item_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional('items')
 def handle_item(item_id):
     if request.method == 'GET':
         try:
-            print(f"📥 GET /items/{item_id}")
-            item = Item.get_by_id(item_id)
+            logger.debug('📥 GET /items/%s', item_id)
+            item = CacheManager.cached(CacheManager.get_item_cache_key(item_id), lambda: load_item(item_id))
             if item:
-                if item.get('is_kit'):
-                    kit_items = KitItem.get_kit_items(item_id)
-                    item['kit_components'] = kit_items
-                    print(f"✅ Item {item_id} retrieved with {len(kit_items)} components")
-                else:
-                    print(f"✅ Item {item_id} retrieved")
                 return jsonify({'item': item, 'success': True}), 200
             else:
-                print(f"❌ Item {item_id} not found")
+                logger.warning('❌ Item %s not found', item_id)
                 return jsonify({'message': 'Item not found', 'success': False}), 404
         except Exception as e:
-            logger.error(f"Error fetching item: {e}")
-            traceback.print_exc()
+            logger.exception(f"Error fetching item: {e}")
             return jsonify({'message': 'Error fetching item', 'success': False}), 500
 
     elif request.method == 'PUT':
@@ -221,11 +269,8 @@ def handle_item(item_id):
             data = request.get_json()
             data['id'] = item_id
             
-            print("\n" + "=" * 80)
-            print(f"📝 PUT /items/{item_id} - UPDATE ITEM")
-            print("=" * 80)
-            print(f"Received data: {data}")
-            print("=" * 80)
+            logger.debug('📝 PUT /items/%s - UPDATE ITEM', item_id)
+            logger.debug('Received data: %s', data)
 
             # Validate required fields
             required_fields = ['code', 'name', 'unit_price', 'stock', 'min_stock']
@@ -237,7 +282,7 @@ def handle_item(item_id):
 
             if missing_fields:
                 error_msg = f'Missing required fields: {", ".join(missing_fields)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
             # Convert data types
@@ -248,97 +293,73 @@ def handle_item(item_id):
                 data['is_kit'] = bool(data.get('is_kit', False))
             except (ValueError, TypeError) as e:
                 error_msg = f'Invalid data type: {str(e)}'
-                print(f"❌ {error_msg}")
+                logger.warning('❌ %s', error_msg)
                 return jsonify({'message': error_msg, 'success': False}), 400
 
-            # Handle HSN code
-            if not data.get('hsn_code') or data.get('hsn_code', '').strip() == '':
-                if data.get('name'):
-                    hsn_data = HSN.get_by_item_name(data['name'])
-                    if hsn_data:
-                        data['hsn_code'] = hsn_data['HSN_CODE']
-                        print(f"✅ Auto-filled HSN: {data['hsn_code']}")
-                    else:
-                        data['hsn_code'] = 'DEFAULT_HSN'
-                else:
-                    data['hsn_code'] = 'DEFAULT_HSN'
-
             # Validate kit items if it's a kit
             if data.get('is_kit'):
                 kit_items = data.get('kit_items', [])
                 if not kit_items or len(kit_items) == 0:
                     error_msg = 'Kit must have at least one component'
-                    print(f"❌ {error_msg}")
+                    logger.warning('❌ %s', error_msg)
                     return jsonify({'message': error_msg, 'success': False}), 400
 
-            print(f"💾 Updating item: {data['code']}")
+            logger.debug('💾 Updating item: %s', data['code'])
             item = Item(data)
             result = item.save()
 
             if result is not None:
-                print(f"✅ Item updated successfully")
+                logger.debug('✅ Item updated successfully')
                 
-                # Update kit items if it's a kit
+                # Bring the stored components in line - only the rows that differ are written.
+                # A database error here fails the request, which rolls the item update back too.
+                kit_diff = None
                 if data.get('is_kit') and 'kit_items' in data:
-                    print(f"🔄 Updating kit components for item {item_id}")
-                    KitItem.delete_kit_items(item_id)
-                    
-                    kit_items = data['kit_items']
-                    success_count = 0
-                    for kit_item_data in kit_items:
-                        try:
-                            kit_item = KitItem({
-                                'kit_id': item_id,
-                                'item_id': int(kit_item_data['item_id']),
-                                'quantity': int(kit_item_data.get('quantity', 1))
-                            })
-                            if kit_item.save():
-                                success_count += 1
-                        except Exception as e:
-                            print(f"⚠️ Error saving component: {e}")
-                            continue
-                    
-                    print(f"✅ Updated {success_count}/{len(kit_items)} components")
+                    logger.debug('🔄 Updating kit components for item %s', item_id)
+                    kit_diff = KitItem.reconcile(item_id, data['kit_items'])
                 elif not data.get('is_kit'):
-                    KitItem.delete_kit_items(item_id)
-                    print(f"✅ Removed kit components (item is no longer a kit)")
+                    kit_diff = KitItem.reconcile(item_id, [])
+                    logger.debug('✅ Removed kit components (item is no longer a kit)')
 
+                if kit_diff and (kit_diff['inserted'] or kit_diff['updated'] or kit_diff['deleted']):
+                    CacheManager.touch('kit_items')
                 CacheManager.clear_items_cache()
                 
-                print("=" * 80)
-                print(f"🎉 SUCCESS - Item {item_id} updated")
-                print("=" * 80 + "\n")
+                logger.debug('🎉 SUCCESS - Item %s updated', item_id)
                 
-                return jsonify({'message': 'Item updated successfully', 'success': True}), 200
+                return jsonify({
+                    'message': 'Item updated successfully',
+                    'kit_items_diff': kit_diff,
+                    'success': True
+                }), 200
             else:
-                print("❌ Failed to update item")
+                logger.warning('❌ Failed to update item')
                 return jsonify({'message': 'Error updating item', 'success': False}), 500
 
         except Exception as e:
             logger.error(f"Error updating item: {e}")
-            print(f"💥 EXCEPTION in PUT /items/{item_id}:")
-            traceback.print_exc()
+            logger.exception('💥 EXCEPTION in PUT /items/%s:', item_id)
             return jsonify({'message': 'Error updating item', 'success': False}), 500
 
     elif request.method == 'DELETE':
         try:
-            print(f"🗑️ DELETE /items/{item_id}")
+            logger.debug('🗑️ DELETE /items/%s', item_id)
             item = Item.get_by_id(item_id)
             if not item:
-                print(f"❌ Item {item_id} not found")
+                logger.warning('❌ Item %s not found', item_id)
                 return jsonify({'message': 'Item not found', 'success': False}), 404
 
             result = Item.delete(item_id)
             if result is not None:
-                CacheManager.clear_items_cache()
-                print(f"✅ Item {item_id} deleted successfully")
+                # Its kit_items rows (as a kit or as a component) go with it
+                CacheManager.touch('items', 'kit_items')
+                logger.debug('✅ Item %s deleted successfully', item_id)
                 return jsonify({'message': 'Item deleted successfully', 'success': True}), 200
             else:
-                print(f"❌ Failed to delete item {item_id}")
+                logger.warning('❌ Failed to delete item %s', item_id)
                 return jsonify({'message': 'Error deleting item', 'success': False}), 500
         except Exception as e:
-            logger.error(f"Error deleting item: {e}")
-            traceback.print_exc()
+            logger.exception(f"Error deleting item: {e}")
             return jsonify({'message': 'Error deleting item', 'success': False}), 500
 
 # ============================
@@ -351,7 +372,8 @@ def search_hsn():
         if not item_name:
             return jsonify({'hsn_codes': [], 'success': True}), 200
         
-        hsn_codes = HSN.search_hsn_by_name(item_name)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        hsn_codes = HSN.search_hsn_by_name(item_name, limit)
         return jsonify({'hsn_codes': hsn_codes, 'success': True}), 200
     except Exception as e:
         logger.error(f"Error searching HSN: {e}")
@@ -361,32 +383,65 @@ def search_hsn():
 def auto_fill_hsn():
     try:
         item_name = request.args.get('item_name', '').strip()
-        print(f"🔍 HSN Auto-fill for: '{item_name}'")
+        logger.debug("🔍 HSN Auto-fill for: '%s'", item_name)
         
         if not item_name:
             return jsonify({'hsn_code': None, 'success': True}), 200
         
+        limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
         hsn_data = HSN.get_by_item_name(item_name)
+        # Ranked alternatives for the picker, best first
+        candidates = HSN.rank(item_name, limit)
         if hsn_data:
-            print(f"✅ HSN Found: {hsn_data['HSN_CODE']}")
+            logger.debug('✅ HSN Found: %s', hsn_data['HSN_CODE'])
             return jsonify({
                 'hsn_code': hsn_data['HSN_CODE'],
                 'description': hsn_data['DESCRIPTION'],
                 'matched_description': hsn_data['DESCRIPTION'],
+                'score': hsn_matcher.score(item_name, hsn_data['id']) if 'id' in hsn_data else None,
+                'candidates': candidates,
                 'success': True
             }), 200
         else:
-            print(f"❌ No HSN found")
+            logger.debug('❌ No HSN found')
             return jsonify({
                 'hsn_code': None, 
                 'description': None,
                 'matched_description': None,
+                'score': None,
+                'candidates': candidates,
                 'success': True
             }), 200
     except Exception as e:
-        print(f"🚨 Error in HSN auto-fill: {e}")
+        logger.error('🚨 Error in HSN auto-fill: %s', e)
         return jsonify({'message': 'Error auto-filling HSN code', 'success': False}), 500
 
+@api.route('/hsn/auto-fill/batch', methods=['POST'])
+def auto_fill_hsn_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        item_names = data.get('item_names')
+        if not isinstance(item_names, list):
+            return jsonify({'message': 'item_names must be a list', 'success': False}), 400
+        if len(item_names) > Config.HSN_BATCH_LIMIT:
+            return jsonify({
+                'message': f'At most {Config.HSN_BATCH_LIMIT} names per request',
+                'success': False
+            }), 400
+
+        results = []
+        for item_name, hsn_data in zip(item_names, HSN.resolve_many([str(n or '') for n in item_names])):
+            results.append({
+                'item_name': item_name,
+                'hsn_code': hsn_data['HSN_CODE'] if hsn_data else None,
+                'description': hsn_data['DESCRIPTION'] if hsn_data else None,
+                'matched_description': hsn_data['DESCRIPTION'] if hsn_data else None,
+            })
+        return jsonify({'results': results, 'count': len(results), 'success': True}), 200
+    except Exception as e:
+        logger.error('🚨 Error in batch HSN auto-fill: %s', e)
+        return jsonify({'message': 'Error auto-filling HSN codes', 'success': False}), 500
+
 @api.route('/hsn/all', methods=['GET'])
 def get_all_hsn():
     try:
@@ -400,9 +455,11 @@ def get_all_hsn():
 # ⚙️ KIT + HEALTH ENDPOINTS
 # ============================
 @api.route('/kit-names', methods=['GET'])
+@conditional('items')
 def get_kit_names():
     try:
-        kit_names = Item.get_kit_names()
+        kit_names = CacheManager.cached(CacheManager.get_kit_names_cache_key(), Item.get_kit_names,
+                                        namespace='kits')
         return jsonify({
             'kit_names': [kn['kit_name'] for kn in kit_names if kn['kit_name']],
             'success': True
@@ -412,23 +469,122 @@ def get_kit_names():
         return jsonify({'message': 'Error fetching kit names', 'success': False}), 500
 
 @api.route('/non-kit-items', methods=['GET'])
+@conditional('items')
 def get_non_kit_items():
     try:
-        items = db.execute_query("SELECT id, code, name, unit_price FROM items WHERE is_kit = FALSE AND status = 'Active'")
+        items = CacheManager.cached(
+            CacheManager.get_non_kit_items_cache_key(),
+            lambda: db.execute_query("SELECT id, code, name, unit_price FROM items WHERE is_kit = FALSE AND status = 'Active'")
+        )
         return jsonify({'items': items if items else [], 'success': True}), 200
     except Exception as e:
         logger.error(f"Error fetching non-kit items: {e}")
         return jsonify({'message': 'Error fetching non-kit items', 'success': False}), 500
 
 @api.route('/kit-components/<int:kit_id>', methods=['GET'])
+@conditional('items')
 def get_kit_components(kit_id):
     try:
-        kit_items = KitItem.get_kit_items(kit_id)
+        kit_items = CacheManager.cached(
+            CacheManager.get_kit_components_cache_key(kit_id),
+            lambda: KitItem.get_kit_items(kit_id),
+            namespace='kits'
+        )
         return jsonify({'kit_components': kit_items, 'success': True}), 200
     except Exception as e:
         logger.error(f"Error fetching kit components: {e}")
         return jsonify({'message': 'Error fetching kit components', 'success': False}), 500
 
+@api.route('/kits/rollup', methods=['GET'])
+@conditional('items')
+def get_kits_rollup():
+    """Cost and buildable count of every kit; ?components=true adds the flattened explosions"""
+    try:
+        if not bom.ensure_fresh():
+            return jsonify({'message': 'Kit graph unavailable', 'success': False}), 503
+        components = request.args.get('components', '').lower() in ('true', '1')
+        kits = bom.rollup_all(components)
+        return jsonify({'kits': kits, 'count': len(kits), 'success': True}), 200
+    except Exception as e:
+        logger.error(f"Error rolling up kits: {e}")
+        return jsonify({'message': 'Error rolling up kits', 'success': False}), 500
+
+@api.route('/kits/<int:kit_id>/bom', methods=['GET'])
+@conditional('items')
+def get_kit_bom(kit_id):
+    """One kit's flattened components, cost and buildable count"""
+    try:
+        if not bom.ensure_fresh([kit_id]):
+            return jsonify({'message': 'Kit graph unavailable', 'success': False}), 503
+        rollup = bom.rollup(kit_id)
+        if rollup is None:
+            return jsonify({'message': 'Kit not found', 'success': False}), 404
+        if 'cycle' in rollup:
+            return jsonify({
+                'message': 'Kit contains itself: ' + ' -> '.join(map(str, rollup['cycle'])),
+                'cycle': rollup['cycle'],
+                'success': False
+            }), 409
+        return jsonify(dict(rollup, success=True)), 200
+    except Exception as e:
+        logger.error(f"Error expanding kit {kit_id}: {e}")
+        return jsonify({'message': 'Error expanding kit', 'success': False}), 500
+
+@api.route('/kits/batch', methods=['POST'])
+def get_kits_batch():
+    """Components and rolled-up values for many kits: {"kit_ids": [...]} or {"kit_ids": "all"}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        kit_ids = data.get('kit_ids')
+        if isinstance(kit_ids, list):
+            try:
+                kit_ids = list(dict.fromkeys(int(kit_id) for kit_id in kit_ids))
+            except (ValueError, TypeError):
+                return jsonify({'message': 'kit_ids must be integers', 'success': False}), 400
+            if len(kit_ids) > Config.KITS_BATCH_LIMIT:
+                return jsonify({
+                    'message': f'At most {Config.KITS_BATCH_LIMIT} kit ids per request',
+                    'success': False
+                }), 400
+        elif kit_ids != 'all':
+            return jsonify({'message': 'kit_ids must be a list or "all"', 'success': False}), 400
+
+        # Unknown ids and plain items are both reported as missing
+        known = KitItem.get_kit_ids() if kit_ids == 'all' else KitItem.get_kit_ids(kit_ids)
+        if known is None:
+            return jsonify({'message': 'Error loading kits', 'success': False}), 500
+        if kit_ids == 'all':
+            kit_ids = known
+        known = set(known)
+        missing = [kit_id for kit_id in kit_ids if kit_id not in known]
+        kit_ids = [kit_id for kit_id in kit_ids if kit_id in known]
+
+        # One query for every kit's components; values come from the memoized kit graph
+        kit_items = KitItem.get_kit_items_many(kit_ids)
+        rolled_up = bom.ensure_fresh(kit_ids)
+        kits = []
+        for kit_id in kit_ids:
+            rollup = bom.rollup(kit_id, components=False) if rolled_up else None
+            if rolled_up and rollup is None:
+                missing.append(kit_id)
+                continue
+            components = kit_items.get(kit_id, [])
+            if rollup is None:
+                # Kit graph unavailable - one level, as /kit-total-value computes it
+                rollup = {'total_cost': float(sum((c['unit_price'] or 0) * c['quantity'] for c in components))}
+            kits.append({
+                'kit_id': kit_id,
+                'kit_components': components,
+                'total_value': rollup.get('total_cost'),
+                'buildable': rollup.get('buildable'),
+                'bottleneck_item_id': rollup.get('bottleneck_item_id'),
+                'cycle': rollup.get('cycle'),
+            })
+        return jsonify({'kits': kits, 'count': len(kits), 'missing': missing, 'success': True}), 200
+    except Exception as e:
+        logger.error(f"Error loading kits batch: {e}")
+        return jsonify({'message': 'Error loading kits', 'success': False}), 500
+
 @api.route('/kit-total-value/<int:kit_id>', methods=['GET'])
 def get_kit_total_value(kit_id):
     try:
@@ -440,12 +596,39 @@ def get_kit_total_value(kit_id):
 
 @api.route('/health', methods=['GET'])
 def health_check():
+    breaker = Database.breaker.stats()
+    if breaker['state'] == 'closed':
+        status, message, code = 'healthy', 'Mechanical Core ERP API is running', 200
+    else:
+        status, message, code = 'unavailable', 'Database unreachable - failing fast', 503
     return jsonify({
-        'status': 'healthy',
-        'message': 'Mechanical Core ERP API is running',
+        'status': status,
+        'message': message,
         'timestamp': datetime.now().isoformat(),
-        'success': True
-    }), 200
+        'database': breaker,
+        'pool': db.pool_stats(),
+        'replicas': db.replica_stats(),
+        'success': code == 200
+    }), code
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        if request.args.get('reset') == '1':
+            query_stats.reset()
+        return jsonify({
+            'queries': query_stats.snapshot(),
+            'pool': db.pool_stats(),
+            'database': Database.breaker.stats(),
+            'replicas': db.replica_stats(),
+            'cache': CacheManager.stats(),
+            'hsn_index': hsn_index.stats(),
+            'bom': bom.stats(),
+            'success': True
+        }), 200
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {e}")
+        return jsonify({'message': 'Error collecting metrics', 'success': False}), 500
 
 @api.route('/')
 def api_root():
@@ -459,10 +642,15 @@ def api_root():
             'non_kit_items': '/api/non-kit-items',
             'kit_components': '/api/kit-components/<kit_id>',
             'kit_total_value': '/api/kit-total-value/<kit_id>',
+            'kits_rollup': '/api/kits/rollup',
+            'kit_bom': '/api/kits/<kit_id>/bom',
+            'kits_batch': '/api/kits/batch',
             'hsn_search': '/api/hsn/search?item_name=<name>',
             'hsn_auto_fill': '/api/hsn/auto-fill?item_name=<name>',
+            'hsn_auto_fill_batch': '/api/hsn/auto-fill/batch',
             'hsn_all': '/api/hsn/all',
-            'health': '/api/health'
+            'health': '/api/health',
+            'metrics': '/api/metrics'
         },
         'success': True
     }), 200
@@ -470,4 +658,4 @@ def api_root():
 def register_routes(app):
     """Registers all API routes with the Flask app."""
     app.register_blueprint(api, url_prefix='/api')
-    print("✅ API routes registered successfully")
\ No newline at end of file
+    logger.info('✅ API routes registered successfully')
\ No newline at end of file
@@ -0,0 +1,283 @@
+# backend/sqlite_compat.py - embedded SQLite behind a pymysql-shaped connection
+"""
+Lets the app (models, routes, raw-cursor code) run on SQLite for benchmarks
+and tests. Connections and cursors mimic the parts of pymysql the code uses:
+DictCursor rows, %s placeholders, lastrowid/rowcount, begin/commit/rollback,
+ping and server_status. Statements go through translate() first, which
+rewrites the MySQL dialect this codebase uses into SQLite.
+"""
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from pymysql.constants import SERVER_STATUS
+
+Error = sqlite3.Error
+
+
+# ============================
+# Dialect shim
+# ============================
+_AUTO_PK = re.compile(r"\bINT(?:EGER)?\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.IGNORECASE)
+_ENUM = re.compile(r"\bENUM\s*\([^)]*\)", re.IGNORECASE)
+_ON_UPDATE = re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", re.IGNORECASE)
+_CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)[^)]*$",
+                           re.IGNORECASE | re.DOTALL)
+_INLINE_INDEX = re.compile(r"^\s*(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)\s*$", re.IGNORECASE)
+_CREATE_INDEX = re.compile(r"^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)", re.IGNORECASE)
+_INSERT = re.compile(r"\s*(?:INSERT|REPLACE)\b", re.IGNORECASE)
+_FUNCTIONS = [
+    (re.compile(r"\bIF\s*\(", re.IGNORECASE), 'IIF('),
+    (re.compile(r"\bJSON_ARRAYAGG\s*\(", re.IGNORECASE), 'json_group_array('),
+    (re.compile(r"\bJSON_OBJECT\s*\(", re.IGNORECASE), 'json_object('),
+    (re.compile(r"\bGREATEST\s*\(", re.IGNORECASE), 'MAX('),
+    (re.compile(r"\bLEAST\s*\(", re.IGNORECASE), 'MIN('),
+    (re.compile(r"\bNOW\s*\(\s*\)", re.IGNORECASE), 'CURRENT_TIMESTAMP'),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE), 'INSERT OR IGNORE'),
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE), ''),
+]
+
+
+def _split_top_level(body):
+    """Split a CREATE TABLE body on commas that are not inside parentheses"""
+    parts, depth, current = [], 0, []
+    for ch in body:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    if ''.join(current).strip():
+        parts.append(''.join(current))
+    return parts
+
+
+def _translate_create_table(match):
+    # SQLite has no inline INDEX clauses - lift them out into CREATE INDEX statements.
+    # Index names are global in SQLite, so they are prefixed with the table name.
+    table, body = match.group(1), match.group(2)
+    columns, indexes = [], []
+    for part in _split_top_level(body):
+        index = _INLINE_INDEX.match(part)
+        if index:
+            unique, name, cols = index.groups()
+            indexes.append(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {table}_{name} ON {table} ({cols})"
+            )
+        else:
+            columns.append(part.strip())
+    create = f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(columns) + "\n)"
+    return [create] + indexes
+
+
+def translate(query):
+    """Rewrite one MySQL statement into one or more SQLite statements"""
+    sql = query.replace('%s', '?')
+    for pattern, replacement in _FUNCTIONS:
+        sql = pattern.sub(replacement, sql)
+
+    create = _CREATE_TABLE.match(sql)
+    if create:
+        sql = _AUTO_PK.sub('INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+        sql = _ENUM.sub('TEXT', sql)
+        sql = _ON_UPDATE.sub('', sql)
+        return _translate_create_table(_CREATE_TABLE.match(sql))
+    # Same table-prefixed naming as the indexes lifted out of CREATE TABLE
+    sql = _CREATE_INDEX.sub(
+        lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS {m.group(3)}_{m.group(2)} ON {m.group(3)}", sql
+    )
+    return [sql]
+
+
+# ============================
+# pymysql-shaped connection
+# ============================
+def _parse_timestamp(value):
+    text = value.decode()
+    try:
+        # Covers what SQLite and the adapters below write; strptime is ~10x slower per row
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return text
+
+
+sqlite3.register_converter('TIMESTAMP', _parse_timestamp)
+sqlite3.register_converter('DATETIME', _parse_timestamp)
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_adapter(datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, float)
+
+
+# MySQL functions SQLite lacks, registered on every connection
+def _concat_ws(separator, *values):
+    # Like MySQL: NULL arguments are skipped, not turned into 'None'
+    return separator.join(str(value) for value in values if value is not None)
+
+
+def _crc32(value):
+    if value is None:
+        return None
+    return zlib.crc32(value.encode() if isinstance(value, str) else str(value).encode())
+
+
+class _BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= value
+
+    def finalize(self):
+        return self.value
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class Cursor:
+    """DictCursor look-alike: %s placeholders, dict rows, pymysql lastrowid semantics"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        self.lastrowid = 0
+        self.rowcount = -1
+
+    def execute(self, query, args=None):
+        self.connection._auto_begin(query)
+        statements = translate(query)
+        for sql in statements:
+            self._cursor.execute(sql, tuple(args) if isinstance(args, list) else (args or ()))
+        self._after(query)
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self.connection._auto_begin(query)
+        (sql,) = translate(query)
+        self._cursor.executemany(sql, [tuple(a) for a in args])
+        self._after(query)
+        return self.rowcount
+
+    def _after(self, query):
+        self.rowcount = self._cursor.rowcount
+        # pymysql reports 0 for anything that isn't an INSERT
+        is_insert = _INSERT.match(query) is not None
+        self.lastrowid = (self._cursor.lastrowid or 0) if is_insert else 0
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Connection:
+    """pymysql.Connection look-alike over sqlite3"""
+
+    def __init__(self, database):
+        uri = database.startswith('file:')
+        self._conn = sqlite3.connect(
+            database,
+            uri=uri,
+            timeout=30,
+            isolation_level=None,  # transactions are explicit, like pymysql autocommit=True
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        self._conn.row_factory = _dict_row
+        self._conn.create_function('CONCAT_WS', -1, _concat_ws, deterministic=True)
+        self._conn.create_function('CRC32', 1, _crc32, deterministic=True)
+        self._conn.create_aggregate('BIT_XOR', 1, _BitXor)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._autocommit = True
+        self.open = True
+
+    @property
+    def server_status(self):
+        return SERVER_STATUS.SERVER_STATUS_IN_TRANS if self._conn.in_transaction else 0
+
+    def cursor(self, cursor=None):
+        # Every sqlite3 cursor steps lazily, so the unbuffered variant is the same class
+        return Cursor(self)
+
+    def begin(self):
+        if not self._conn.in_transaction:
+            self._conn.execute('BEGIN')
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+
+    def get_autocommit(self):
+        return self._autocommit
+
+    def autocommit(self, value):
+        self._autocommit = bool(value)
+
+    def _auto_begin(self, query):
+        if not self._autocommit and not self._conn.in_transaction \
+                and not query.lstrip().upper().startswith('SELECT'):
+            self.begin()
+
+    def ping(self, reconnect=False):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self._conn.close()
+
+
+# In-memory databases vanish with their last connection, so keep one open per name
+_memory_keepers = {}
+_memory_lock = threading.Lock()
+
+
+def connect(path):
+    """Open a connection to a SQLite file, or to a named shared in-memory database (':memory:' or 'memory:<name>')"""
+    if path == ':memory:' or path.startswith('memory:'):
+        name = path.partition(':')[2].strip(':') or 'erp'
+        database = f'file:{name}?mode=memory&cache=shared'
+        with _memory_lock:
+            if database not in _memory_keepers:
+                _memory_keepers[database] = Connection(database)
+        return Connection(database)
+
+    conn = Connection(path)
+    # WAL lets readers run alongside the single writer
+    conn._conn.execute('PRAGMA journal_mode = WAL')
+    return conn
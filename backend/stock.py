@@ -0,0 +1,148 @@
+# backend/stock.py - stock movements for invoice lines
+"""
+Every invoice path that moves stock (create/update as Finalized, finalize,
+delete of a finalized invoice) goes through StockMovement.apply on the
+route's own cursor, so the movement commits or rolls back with the invoice.
+
+One movement is two statements however many lines the invoice has:
+
+- SELECT ... WHERE id IN (...) ORDER BY id FOR UPDATE - locks the rows in id
+  order, so two invoices sharing items queue instead of deadlocking
+- one UPDATE with a CASE per item, relative to the stored stock - no value
+  read earlier is written back, so concurrent movements can't undo each other
+
+Decrements clamp at zero as before; with STOCK_STRICT on, a line that would
+take an item below zero fails the whole movement with InsufficientStock.
+"""
+import logging
+from backend.config import Config
+from backend.database import Database
+
+logger = logging.getLogger(__name__)
+db = Database()
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        super().__init__(f"Insufficient stock for {len(shortages)} items")
+        self.shortages = shortages
+
+
+def line_quantity(line):
+    """A line's quantity - 1 when the line leaves it out, as the invoice_items row is written"""
+    return line.get('quantity', 1)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _shortage(row, required):
+    return {
+        'item_id': row['id'],
+        'item_code': row['code'],
+        'item_name': row['name'],
+        'available_stock': row['stock'],
+        'required_quantity': required,
+        'shortage': required - row['stock'],
+    }
+
+
+class StockMovement:
+    @staticmethod
+    def quantities(lines):
+        """item_id -> total quantity over the lines, by item id (lines without an item are skipped)"""
+        totals = {}
+        for line in lines:
+            if not line.get('item_id'):
+                continue
+            try:
+                item_id, quantity = int(line['item_id']), int(line_quantity(line))
+            except (ValueError, TypeError) as e:
+                logger.warning('⚠️ Skipping invalid stock line %s: %s', line, e)
+                continue
+            totals[item_id] = totals.get(item_id, 0) + quantity
+        return {item_id: totals[item_id] for item_id in sorted(totals) if totals[item_id]}
+
+    @staticmethod
+    def apply(cursor, lines, restore=False, strict=None):
+        """Take the lines' quantities out of stock (or put them back with restore=True).
+
+        Runs on cursor's transaction. Returns one result per item, in id order:
+        item_id, item_code, item_name, quantity, previous_stock, new_stock and
+        clamped - or found=False for an item that no longer exists.
+        """
+        strict = Config.STOCK_STRICT if strict is None else strict
+        totals = StockMovement.quantities(lines)
+        if not totals:
+            return []
+        ids = list(totals)
+
+        cursor.execute(
+            f"SELECT id, code, name, stock FROM items WHERE id IN ({_placeholders(ids)}) ORDER BY id FOR UPDATE",
+            ids
+        )
+        rows = {row['id']: row for row in cursor.fetchall()}
+
+        if strict and not restore:
+            shortages = [_shortage(rows[i], totals[i]) for i in ids if i in rows and rows[i]['stock'] < totals[i]]
+            if shortages:
+                raise InsufficientStock(shortages)
+
+        found = [i for i in ids if i in rows]
+        if found:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(found))
+            params = [value for i in found for value in (i, totals[i])]
+            # Restores add back exactly what was taken; decrements never go below zero
+            new_stock = f"stock + (CASE id {cases} END)" if restore else f"GREATEST(stock - (CASE id {cases} END), 0)"
+            cursor.execute(
+                f"UPDATE items SET stock = {new_stock} WHERE id IN ({_placeholders(found)})",
+                params + found
+            )
+
+        results = []
+        for item_id in ids:
+            row = rows.get(item_id)
+            if row is None:
+                logger.warning('❌ Item not found for stock update: %s', item_id)
+                results.append({'item_id': item_id, 'quantity': totals[item_id], 'found': False})
+                continue
+            # The rows are locked, so the stored stock is still what the SELECT saw
+            previous = row['stock']
+            if restore:
+                new, clamped = previous + totals[item_id], False
+            else:
+                new = max(previous - totals[item_id], 0)
+                clamped = previous - totals[item_id] < 0
+                if clamped:
+                    logger.warning('⚠️ Warning: Stock would go negative for item %s. Setting to 0.', item_id)
+            results.append({
+                'item_id': item_id,
+                'item_code': row['code'],
+                'item_name': row['name'],
+                'quantity': totals[item_id],
+                'previous_stock': previous,
+                'new_stock': new,
+                'clamped': clamped,
+                'found': True,
+            })
+        logger.debug('📦 Stock %s for %s items', 'restored' if restore else 'reduced', len(found))
+        return results
+
+    @staticmethod
+    def check(lines):
+        """Items whose stock can't cover the lines, in id order (one query, no locks)"""
+        totals = StockMovement.quantities(lines)
+        if not totals:
+            return []
+        ids = list(totals)
+        rows = db.execute_query(f"SELECT id, code, name, stock FROM items WHERE id IN ({_placeholders(ids)})", ids)
+        if rows is None:
+            raise RuntimeError('Could not read stock levels')
+        return [_shortage(row, totals[row['id']])
+                for row in sorted(rows, key=lambda row: row['id']) if row['stock'] < totals[row['id']]]
+
+    @staticmethod
+    def moved(results):
+        """How many items a movement changed"""
+        return sum(1 for result in results if result['found'])
@@ -0,0 +1,91 @@
+# backend/streaming.py - chunked JSON / NDJSON responses for large list endpoints
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """NDJSON on ?format=ndjson or an Accept header that asks for it"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return NDJSON_MIMETYPE in request.headers.get('Accept', '')
+
+
+def _batched(lines, batch_size):
+    # Join a few rows per write - one tiny chunk per row costs more than it saves
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _json_body(rows, key, dumps):
+    """Same shape as jsonify({key: [...], 'count': n, 'success': True})"""
+    count = 0
+    if key:
+        yield '{"%s":[' % key
+    else:
+        yield '['
+    for row in rows:
+        yield (',' if count else '') + dumps(row)
+        count += 1
+    if key:
+        yield '],"count":%d,"success":true}\n' % count
+    else:
+        yield ']\n'
+
+
+def _ndjson_body(rows, dumps):
+    for row in rows:
+        yield dumps(row) + '\n'
+
+
+def _body(rows, key, fmt):
+    provider = current_app.json
+
+    def dumps(row):
+        return provider.dumps(row, separators=(',', ':'))
+
+    if fmt == 'ndjson':
+        return _ndjson_body(rows, dumps), NDJSON_MIMETYPE
+    return _json_body(rows, key, dumps), 'application/json'
+
+
+def render_rows(rows, key=None, fmt='json'):
+    """The whole body stream_rows() would send, as (text, mimetype) - for caching"""
+    body, mimetype = _body(rows, key, fmt)
+    return ''.join(body), mimetype
+
+
+def _tee(chunks, on_complete):
+    # Only a body that was generated to the end is handed over
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    on_complete(''.join(parts))
+
+
+def stream_rows(rows, key=None, batch_size=100, on_complete=None):
+    """Stream an iterable of rows as JSON, or NDJSON when the client asks for it.
+
+    With a key the body matches the existing {key: [...], count, success}
+    envelope, without one it is a bare array. Rows are serialized as they
+    arrive, so memory stays flat however many rows the query returns.
+    on_complete(body) is called with the full text once the last chunk is sent.
+    """
+    body, mimetype = _body(rows, key, body_format())
+    chunks = _batched(body, batch_size)
+    if on_complete is not None:
+        # The callback may need the app (e.g. the cache) after the view has returned
+        chunks = stream_with_context(_tee(chunks, on_complete))
+    return Response(chunks, mimetype=mimetype)
+
+
+def body_format():
+    """'ndjson' or 'json' - the variant stream_rows() will produce for this request"""
+    return 'ndjson' if wants_ndjson() else 'json'